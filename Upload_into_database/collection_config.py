@@ -0,0 +1,222 @@
+import os
+import time
+import argparse
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    VectorParams,
+    VectorParamsDiff,
+    Distance,
+    HnswConfigDiff,
+    OptimizersConfigDiff,
+    CollectionStatus,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    SearchParams,
+    QuantizationSearchParams,
+    PayloadSchemaType,
+)
+
+load_dotenv()
+
+VECTOR_SIZE = 1024
+
+# Defaults for new legal collections, overridable per call or from the CLI
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")  # none | int8 | binary
+VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "false").lower() == "true"
+HNSW_M = int(os.getenv("QDRANT_HNSW_M", 16))
+HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 100))
+# Query-time oversampling for quantized collections; 0 leaves Qdrant's default
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", 0))
+
+BULK_GREEN_TIMEOUT_SECONDS = float(os.getenv("BULK_GREEN_TIMEOUT_SECONDS", 1800))
+BULK_GREEN_POLL_SECONDS = float(os.getenv("BULK_GREEN_POLL_SECONDS", 2))
+# Qdrant's default, restored when the collection reports no explicit threshold
+DEFAULT_INDEXING_THRESHOLD = int(os.getenv("DEFAULT_INDEXING_THRESHOLD", 20000))
+
+# Keyword indexes for the payload fields that retrieval filters on and that
+# re-ingestion scrolls by; without them each filter is a full collection scan
+PAYLOAD_INDEXES = {
+    "nepal_constitution": ["metadata.article_number", "metadata.law_name"],
+    "nepal_acts": ["metadata.section_number", "metadata.law_name", "metadata.document_name"],
+    "case_laws": ["metadata.case_key", "metadata.document_name"],
+}
+
+
+# =========================
+# CONFIG BUILDERS
+# =========================
+def quantization_config(kind: str):
+    kind = (kind or "none").lower()
+
+    if kind == "int8":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif kind == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    elif kind == "none":
+        return None
+
+    raise ValueError(f"Unknown quantization '{kind}', expected none, int8 or binary")
+
+
+def search_params(rescore: bool = True, oversampling: float = QUANTIZATION_OVERSAMPLING):
+    """
+    Search params for quantized collections: score with the quantized
+    vectors, then rescore the oversampled candidates with the originals.
+    """
+    if not oversampling:
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    )
+
+
+# =========================
+# CREATE / MIGRATE
+# =========================
+def create_legal_collection(
+    client: QdrantClient,
+    collection_name: str,
+    vector_size: int = VECTOR_SIZE,
+    quantization: str = QUANTIZATION,
+    on_disk: bool = VECTORS_ON_DISK,
+    hnsw_m: int = HNSW_M,
+    ef_construct: int = HNSW_EF_CONSTRUCT
+) -> bool:
+    """
+    Creates a COSINE collection with the given storage options and makes
+    sure its payload indexes exist. Returns False if it already existed.
+    """
+    if client.collection_exists(collection_name):
+        ensure_payload_indexes(client, collection_name)
+        return False
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(
+            size=vector_size,
+            distance=Distance.COSINE,
+            on_disk=on_disk
+        ),
+        hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct),
+        quantization_config=quantization_config(quantization)
+    )
+    ensure_payload_indexes(client, collection_name)
+    return True
+
+
+def ensure_payload_indexes(client: QdrantClient, collection_name: str):
+    for field_name in PAYLOAD_INDEXES.get(collection_name, []):
+        try:
+            # A no-op when the index already exists
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+        except Exception as e:
+            print(f"[COLLECTION] payload index {collection_name}.{field_name} skipped: {e}")
+
+
+def migrate_collection(
+    client: QdrantClient,
+    collection_name: str,
+    quantization: str = None,
+    on_disk: bool = None,
+    hnsw_m: int = None,
+    ef_construct: int = None
+):
+    """
+    Applies storage options to an existing collection in place. Options
+    left as None are unchanged; Qdrant rebuilds indexes in the background.
+    """
+    kwargs = {}
+
+    if quantization is not None:
+        kwargs["quantization_config"] = quantization_config(quantization) or Disabled.DISABLED
+    if on_disk is not None:
+        kwargs["vectors_config"] = {"": VectorParamsDiff(on_disk=on_disk)}
+    if hnsw_m is not None or ef_construct is not None:
+        kwargs["hnsw_config"] = HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct)
+
+    if not kwargs:
+        print("Nothing to migrate")
+        return
+
+    client.update_collection(collection_name=collection_name, **kwargs)
+    print(f"✅ Updated {collection_name}: {', '.join(kwargs)}")
+
+
+# =========================
+# BULK LOAD
+# =========================
+def pause_indexing(client: QdrantClient, collection_name: str) -> int:
+    """Stops HNSW indexing of new segments and returns the threshold to restore."""
+    info = client.get_collection(collection_name)
+    previous = info.config.optimizer_config.indexing_threshold
+    # None would make the restore a no-op, and 0 is what an interrupted bulk
+    # run leaves behind; restoring either would leave the collection unindexed
+    if not previous:
+        previous = DEFAULT_INDEXING_THRESHOLD
+
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+    )
+    return previous
+
+
+def resume_indexing(client: QdrantClient, collection_name: str, indexing_threshold: int):
+    if not indexing_threshold:
+        indexing_threshold = DEFAULT_INDEXING_THRESHOLD
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+    )
+    print(f"✅ Restored indexing_threshold={indexing_threshold} on {collection_name}")
+
+
+def wait_until_green(client: QdrantClient, collection_name: str,
+                     timeout: float = BULK_GREEN_TIMEOUT_SECONDS,
+                     poll: float = BULK_GREEN_POLL_SECONDS) -> bool:
+    deadline = time.monotonic() + timeout
+    nudged = False
+
+    while time.monotonic() < deadline:
+        status = client.get_collection(collection_name).status
+        if status == CollectionStatus.GREEN:
+            return True
+        # Grey = optimizations pending but not started; an empty update triggers them
+        if status == CollectionStatus.GREY and not nudged:
+            client.update_collection(collection_name=collection_name, optimizers_config=OptimizersConfigDiff())
+            nudged = True
+        time.sleep(poll)
+
+    print(f"⚠️ {collection_name} not green after {timeout:.0f}s")
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate storage options of an existing legal collection")
+    parser.add_argument("collection")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"])
+    parser.add_argument("--on-disk", dest="on_disk", action="store_true", default=None)
+    parser.add_argument("--in-ram", dest="on_disk", action="store_false")
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--ef-construct", type=int)
+    args = parser.parse_args()
+
+    migrate_collection(
+        QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60),
+        args.collection,
+        quantization=args.quantization,
+        on_disk=args.on_disk,
+        hnsw_m=args.m,
+        ef_construct=args.ef_construct
+    )
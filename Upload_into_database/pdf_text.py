@@ -0,0 +1,55 @@
+import os
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 0 = one worker per core
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", 0))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 32))
+# Below this many pages process start-up costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 96))
+
+
+# =========================
+# PAGE-PARALLEL EXTRACTION
+# =========================
+def _extract_range(pdf_path: str, start: int, end: int) -> list[str]:
+    with fitz.open(pdf_path) as doc:
+        return [doc[p].get_text() for p in range(start, end)]
+
+
+def default_workers() -> int:
+    # Inside an ingestion worker the files are already spread across cores
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+
+
+def iter_pages(pdf_path: str, start: int = 0, end: int = None, workers: int = None):
+    """
+    Yields the text of pages [start, end) in order. Ranges of
+    PDF_PAGES_PER_TASK pages are extracted in worker processes, and each
+    range's pages are yielded as soon as it (and all earlier ones) finish.
+    """
+    with fitz.open(pdf_path) as doc:
+        total = doc.page_count
+    end = total if end is None else min(end, total)
+    workers = workers or default_workers()
+
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, end)) for s in range(start, end, PDF_PAGES_PER_TASK)]
+
+    if workers <= 1 or len(ranges) <= 1 or end - start < PDF_PARALLEL_MIN_PAGES:
+        with fitz.open(pdf_path) as doc:
+            for p in range(start, end):
+                yield doc[p].get_text()
+        return
+
+    starts, ends = zip(*ranges)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        for pages in pool.map(_extract_range, repeat(pdf_path), starts, ends):
+            yield from pages
+
@@ -0,0 +1,586 @@
+import os
+import json
+import time
+import uuid
+import random
+import queue
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, PointIdsList, Filter, FieldCondition, MatchValue
+from embedding import embeddings
+from Upload_into_database.collection_config import pause_indexing, resume_indexing, wait_until_green
+
+load_dotenv()
+
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 2))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 64))
+INGEST_UPLOAD_BATCH = int(os.getenv("INGEST_UPLOAD_BATCH", 64))
+INGEST_UPLOAD_WORKERS = int(os.getenv("INGEST_UPLOAD_WORKERS", 4))
+# Batches waiting between stages; bounds memory regardless of corpus size
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+INGEST_UPLOAD_RETRIES = int(os.getenv("INGEST_UPLOAD_RETRIES", 3))
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", 1.0))
+# How often a blocked queue put/get re-checks whether another stage died
+INGEST_QUEUE_POLL_SECONDS = float(os.getenv("INGEST_QUEUE_POLL_SECONDS", 1.0))
+INGEST_MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", ".ingest_manifest")
+# Manifest IDs checked against Qdrant before a manifest is trusted
+INGEST_MANIFEST_SAMPLE = int(os.getenv("INGEST_MANIFEST_SAMPLE", 8))
+QDRANT_URL = os.getenv("QDRANT_URL")
+# Pause HNSW indexing during the upload and rebuild once at the end
+INGEST_BULK_LOAD = os.getenv("INGEST_BULK_LOAD", "false").lower() == "true"
+
+# Fixed namespace so the same section always maps to the same point ID
+POINT_ID_NAMESPACE = uuid.UUID("5b0f6d8e-3c1a-4f57-9a43-2f1d7c9e8b10")
+
+_DONE = object()
+
+
+# =========================
+# DETERMINISTIC IDS + MANIFEST
+# =========================
+def point_id(chunk: dict) -> str:
+    """uuid5 of (doc_type, law_name, chapter/case, section/article, content hash)."""
+    metadata = chunk["metadata"]
+    content_hash = hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()
+    key = "|".join(str(part) for part in (
+        metadata.get("doc_type"),
+        metadata.get("law_name"),
+        metadata.get("chapter_number") or metadata.get("part_title") or metadata.get("case_key"),
+        metadata.get("section_number") or metadata.get("article_number") or metadata.get("section"),
+        content_hash,
+    ))
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+
+class IngestManifest:
+    """
+    Point IDs last ingested per document, one JSON file per document,
+    under a directory per Qdrant cluster and collection.
+    """
+
+    def __init__(self, root: str, collection_name: str, qdrant_url: str = QDRANT_URL):
+        cluster = hashlib.sha1((qdrant_url or "").encode("utf-8")).hexdigest()[:12]
+        self.root = os.path.join(root, cluster, collection_name) if root else None
+
+    def _path(self, document_name: str) -> str:
+        digest = hashlib.sha1(document_name.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, f"{digest}.json")
+
+    def ids(self, document_name: str):
+        """Stored IDs, or None if this document has no manifest yet."""
+        if not self.root:
+            return None
+        try:
+            with open(self._path(document_name), encoding="utf-8") as f:
+                return set(json.load(f)["ids"])
+        except FileNotFoundError:
+            return None
+
+    def save(self, document_name: str, ids):
+        if not self.root:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(document_name)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"document": document_name, "ids": sorted(ids)}, f)
+        os.replace(tmp, path)
+
+
+# =========================
+# STREAMING INGESTION
+# =========================
+class IngestionPipeline:
+    """
+    parse (process pool) -> embed queue -> embedder thread -> upload queue -> uploader threads
+
+    parse_fn(task) runs in a worker process and returns
+    (document_name, chunks, stats), or a list of those, where chunks are
+    {"text", "metadata"} dicts and stats is merged into that document's
+    summary entry.
+
+    Point IDs are deterministic, so a re-ingest only embeds and upserts
+    sections whose content changed. Points a document no longer produces
+    are deleted once its new points are uploaded. Documents are matched to
+    their stored points through the manifest, once a sample of its IDs is
+    confirmed in Qdrant, or through document_field in Qdrant otherwise.
+
+    When documents come in groups from one source file (the cases of a
+    DOCX), source_field/source_of name that file instead: its stored
+    points are scrolled once per source, and documents the source no
+    longer contains are deleted after the run.
+
+    If the embedder or an uploader thread dies, the other stages stop at
+    their next queue operation and run() raises. Document names must be
+    unique within a run; a repeated name is skipped and reported.
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, parse_fn,
+                 parse_workers: int = INGEST_PARSE_WORKERS,
+                 embed_batch: int = INGEST_EMBED_BATCH,
+                 upload_batch: int = INGEST_UPLOAD_BATCH,
+                 upload_workers: int = INGEST_UPLOAD_WORKERS,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 document_field: str = "metadata.document_name",
+                 manifest_dir: str = INGEST_MANIFEST_DIR,
+                 bulk: bool = INGEST_BULK_LOAD,
+                 log_documents: bool = True,
+                 qdrant_url: str = QDRANT_URL,
+                 source_field: str = None,
+                 source_of=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.parse_fn = parse_fn
+        self.parse_workers = parse_workers
+        self.embed_batch = embed_batch
+        self.upload_batch = upload_batch
+        self.upload_workers = upload_workers
+        self.document_field = document_field
+        self.source_field = source_field
+        self.source_of = source_of
+        # Sources are checked against Qdrant directly; no per-document manifests for them
+        self.manifest = IngestManifest(None if source_field else manifest_dir, collection_name, qdrant_url)
+        self.bulk = bulk
+        self.phase_seconds = {}
+        self.task_count = 0
+        self.log_documents = log_documents
+        # Set in run(); a first load has nothing to look up per document
+        self.collection_empty = False
+
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.upload_queue = queue.Queue(maxsize=queue_size)
+
+        self.summary = {}
+        self._pending = {}
+        # document_name -> (current ids, ids to delete once the upload succeeds)
+        self._documents = {}
+        self._lock = threading.Lock()
+        # Set when the embedder or an uploader dies, so no stage blocks on it forever
+        self._failed = threading.Event()
+        self._failure = None
+        # Bulk mode: documents whose cleanup waits until the collection is green
+        self._deferred = []
+        # source -> {document_name: stored ids}, filled by one scroll per source
+        self._sources = {}
+
+    # ---------- bookkeeping ----------
+    def _stored_ids(self, document_name: str) -> set:
+        ids = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(must=[
+                    FieldCondition(key=self.document_field, match=MatchValue(value=document_name))
+                ]),
+                with_payload=False,
+                with_vectors=False,
+                limit=1000,
+                offset=offset
+            )
+            ids.update(str(p.id) for p in points)
+            if offset is None:
+                return ids
+
+    def _source_documents(self, source: str) -> dict:
+        """Stored ids of every document of a source, grouped by document_field."""
+        if source in self._sources:
+            return self._sources[source]
+
+        documents = defaultdict(set)
+        offset = None
+        path = self.document_field.split(".")
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(must=[
+                    FieldCondition(key=self.source_field, match=MatchValue(value=source))
+                ]),
+                with_payload=[self.document_field],
+                with_vectors=False,
+                limit=1000,
+                offset=offset
+            )
+            for p in points:
+                value = p.payload
+                for key in path:
+                    value = (value or {}).get(key)
+                documents[value].add(str(p.id))
+            if offset is None:
+                break
+
+        self._sources[source] = documents
+        return documents
+
+    def _manifest_ids(self, document_name: str):
+        """The manifest's IDs if a sample of them is still in Qdrant, else None."""
+        # A recreated or emptied collection holds none of what the manifest lists
+        if self.collection_empty:
+            return None
+
+        ids = self.manifest.ids(document_name)
+        if not ids:
+            return ids
+
+        sample = random.sample(sorted(ids), min(len(ids), INGEST_MANIFEST_SAMPLE))
+        found = self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=sample,
+            with_payload=False,
+            with_vectors=False
+        )
+        if len(found) < len(sample):
+            print(f"⚠️ Manifest for {document_name} is out of date with {self.collection_name}, rechecking Qdrant")
+            return None
+        return ids
+
+    def _file_parsed(self, document_name: str, chunks: list, stats: dict) -> list:
+        """Records the document and returns the (id, chunk) pairs that need uploading."""
+        if document_name in self.summary:
+            # Two sources with the same name would share one manifest and summary entry
+            print(f"❌ Skipping {document_name}: a document with this name was already ingested in this run")
+            with self._lock:
+                self.summary[f"{document_name} (duplicate)"] = {"error": "duplicate document name"}
+            return []
+
+        current = {}
+        for chunk in chunks:
+            current.setdefault(point_id(chunk), chunk)
+
+        if self.collection_empty:
+            existing = set()
+        elif self.source_field:
+            existing = self._source_documents(self.source_of(document_name)).get(document_name, set())
+        else:
+            existing = self._manifest_ids(document_name)
+            if existing is None:
+                existing = self._stored_ids(document_name)
+
+        changed = [(pid, chunk) for pid, chunk in current.items() if pid not in existing]
+        # An empty parse is more likely a broken PDF than a repealed Act
+        removed = existing - current.keys() if current else set()
+
+        with self._lock:
+            self.summary[document_name] = {
+                **stats,
+                "sections": len(chunks),
+                "unchanged": len(current) - len(changed),
+                "uploaded": 0,
+                "failed": 0,
+                "deleted": 0
+            }
+            self._pending[document_name] = len(changed)
+            self._documents[document_name] = (current.keys(), removed)
+
+        if self.log_documents:
+            print(f"\n📘 Parsed: {document_name}")
+            for key, value in stats.items():
+                print(f"   ➤ {key.capitalize()}: {value}")
+            print(f"   ➤ Sections: {len(chunks)} ({len(changed)} new or changed, {len(removed)} removed)")
+
+        if not changed:
+            self._finish_document(document_name)
+        return changed
+
+    def _points_done(self, document_names: list, ok: bool):
+        finished = []
+        with self._lock:
+            for name in document_names:
+                self.summary[name]["uploaded" if ok else "failed"] += 1
+                self._pending[name] -= 1
+                if self._pending[name] == 0:
+                    finished.append(name)
+
+        for name in finished:
+            self._finish_document(name)
+
+    def _finish_document(self, document_name: str):
+        entry = self.summary[document_name]
+        current, removed = self._documents.pop(document_name)
+
+        # Keep the old points (and manifest) if anything failed, so the next run retries
+        if entry["failed"] == 0:
+            if self.bulk:
+                # Bulk upserts are only acknowledged, not applied; clean up once green
+                with self._lock:
+                    self._deferred.append((document_name, current, removed))
+            else:
+                self._cleanup(document_name, current, removed)
+
+        if self.log_documents or entry["failed"]:
+            print(f"✅ {document_name}: {entry['uploaded']} uploaded, {entry['unchanged']} unchanged, "
+                  f"{entry['deleted']} deleted, {entry['failed']} failed")
+
+    def _cleanup(self, document_name: str, current, removed: set):
+        entry = self.summary[document_name]
+        try:
+            if removed:
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=list(removed)),
+                    wait=True
+                )
+                entry["deleted"] = len(removed)
+            self.manifest.save(document_name, current)
+        except Exception as e:
+            print(f"❌ Cleanup of {document_name} failed: {e}")
+
+    def _cleanup_deferred(self):
+        for document_name, current, removed in self._deferred:
+            self._cleanup(document_name, current, removed)
+        self._deferred = []
+
+    def _delete_removed_documents(self):
+        """Deletes the points of documents their source no longer contains."""
+        for source, documents in self._sources.items():
+            # A source that failed to parse is incomplete, not emptied
+            if "error" in self.summary.get(source, {}):
+                print(f"⚠️ Not deleting removed documents of {source}: it did not parse completely")
+                continue
+
+            for document_name, ids in documents.items():
+                if document_name in self.summary:
+                    continue
+                try:
+                    self.client.delete(
+                        collection_name=self.collection_name,
+                        points_selector=PointIdsList(points=list(ids)),
+                        wait=True
+                    )
+                except Exception as e:
+                    print(f"❌ Deleting removed document {document_name} failed: {e}")
+                    continue
+                self.summary[document_name] = {
+                    "sections": 0, "unchanged": 0, "uploaded": 0, "failed": 0,
+                    "deleted": len(ids), "removed": True
+                }
+
+    # ---------- stages ----------
+    def _parse_all(self, tasks):
+        # At most parse_workers * 2 tasks in flight, so parsed results cannot pile up
+        # while the embed queue is full. tasks may be a lazy generator.
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+                remaining = iter(tasks)
+                in_flight = {}
+
+                def submit_next():
+                    task = next(remaining, None)
+                    if task is not None:
+                        in_flight[pool.submit(self.parse_fn, task)] = task
+                        self.task_count += 1
+
+                for _ in range(self.parse_workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = in_flight.pop(future)
+                        submit_next()
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            label = os.path.basename(task) if isinstance(task, str) else str(task[0])
+                            print(f"❌ Failed to parse {label}: {e}")
+                            with self._lock:
+                                self.summary[label] = {"error": str(e)}
+                            continue
+
+                        # A task yields one document (a PDF) or a list of them (a batch of cases)
+                        for document_name, chunks, stats in (result if isinstance(result, list) else [result]):
+                            changed = self._file_parsed(document_name, chunks, stats)
+                            for start in range(0, len(changed), self.embed_batch):
+                                batch = changed[start:start + self.embed_batch]
+                                self._put(self.embed_queue, [(document_name, pid, c) for pid, c in batch])
+        finally:
+            if not self._failed.is_set():
+                self._put(self.embed_queue, _DONE)
+
+    # ---------- queues ----------
+    def _put(self, q: queue.Queue, item):
+        # A bounded put would block forever once the consumer thread is gone
+        while True:
+            if self._failed.is_set():
+                raise RuntimeError(f"ingestion aborted: {self._failure}")
+            try:
+                q.put(item, timeout=INGEST_QUEUE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=INGEST_QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if self._failed.is_set():
+                    return _DONE
+
+    def _guarded(self, stage):
+        try:
+            stage()
+        except BaseException as e:
+            # Keep the first failure; the others are stages stopping because of it
+            if not self._failed.is_set():
+                self._failure = f"{threading.current_thread().name}: {e!r}"
+                self._failed.set()
+                print(f"❌ {self._failure}")
+
+    def _next_embed_batch(self):
+        """
+        Up to embed_batch queued chunks, coalescing the small per-document
+        batches of short documents. Returns (chunks, finished).
+        """
+        batch = self._get(self.embed_queue)
+        if batch is _DONE:
+            return [], True
+
+        pending = list(batch)
+        while len(pending) < self.embed_batch:
+            try:
+                batch = self.embed_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is _DONE:
+                return pending, True
+            pending.extend(batch)
+        return pending, False
+
+    def _embed_loop(self):
+        buffer = []
+        finished = False
+        while not finished:
+            pending, finished = self._next_embed_batch()
+
+            for start in range(0, len(pending), self.embed_batch):
+                batch = pending[start:start + self.embed_batch]
+                try:
+                    vectors = embeddings.embed_documents([c["text"] for _, _, c in batch])
+                except Exception as e:
+                    print(f"❌ Embedding failed for {len(batch)} chunks: {e}")
+                    self._points_done([name for name, _, _ in batch], ok=False)
+                    continue
+
+                for (name, pid, chunk), vector in zip(batch, vectors):
+                    buffer.append((name, self.point(pid, chunk, vector)))
+                    if len(buffer) >= self.upload_batch:
+                        self._put(self.upload_queue, buffer)
+                        buffer = []
+
+        if buffer:
+            self._put(self.upload_queue, buffer)
+        for _ in range(self.upload_workers):
+            self._put(self.upload_queue, _DONE)
+
+    def _upload_loop(self):
+        while True:
+            batch = self._get(self.upload_queue)
+            if batch is _DONE:
+                return
+
+            names = [name for name, _ in batch]
+            try:
+                self._upsert_with_retries([point for _, point in batch])
+            except Exception as e:
+                print(f"❌ Upload of {len(batch)} points failed: {e}")
+                self._points_done(names, ok=False)
+            else:
+                self._points_done(names, ok=True)
+
+    def _upsert_with_retries(self, points: list):
+        if self.bulk:
+            # Acknowledged on receipt; wait_until_green covers the apply + index
+            self.client.upload_points(
+                collection_name=self.collection_name,
+                points=points,
+                batch_size=len(points),
+                max_retries=INGEST_UPLOAD_RETRIES,
+                wait=False
+            )
+            return
+
+        for attempt in range(INGEST_UPLOAD_RETRIES + 1):
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+                return
+            except Exception:
+                if attempt == INGEST_UPLOAD_RETRIES:
+                    raise
+                time.sleep(INGEST_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    @staticmethod
+    def point(pid: str, chunk: dict, vector) -> PointStruct:
+        # Same payload layout QdrantVectorStore writes and reads
+        return PointStruct(
+            id=pid,
+            vector=[float(x) for x in vector],
+            payload={"page_content": chunk["text"], "metadata": chunk["metadata"]}
+        )
+
+    def _stream(self, tasks):
+        embedder = threading.Thread(target=self._guarded, args=(self._embed_loop,), name="ingest-embed", daemon=True)
+        uploaders = [
+            threading.Thread(target=self._guarded, args=(self._upload_loop,), name=f"ingest-upload-{i}", daemon=True)
+            for i in range(self.upload_workers)
+        ]
+        embedder.start()
+        for t in uploaders:
+            t.start()
+
+        try:
+            self._parse_all(tasks)
+        finally:
+            embedder.join()
+            for t in uploaders:
+                t.join()
+
+        if self._failed.is_set():
+            raise RuntimeError(f"ingestion aborted: {self._failure}")
+
+    def _phase(self, name: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.phase_seconds[name] = round(time.perf_counter() - started, 2)
+            print(f"⏱️ {name}: {self.phase_seconds[name]:.1f}s")
+
+    def _run_bulk(self, tasks):
+        threshold = self._phase("pause_indexing", pause_indexing, self.client, self.collection_name)
+        try:
+            self._phase("upload", self._stream, tasks)
+        finally:
+            # Always restore, a failed load must not leave the live collection unindexed
+            self._phase("resume_indexing", resume_indexing, self.client, self.collection_name, threshold)
+
+        # Only delete replaced points and record manifests once the writes are applied
+        if self._phase("wait_green", wait_until_green, self.client, self.collection_name):
+            self._phase("cleanup", self._cleanup_deferred)
+            self._delete_removed_documents()
+        else:
+            print(f"⚠️ Skipped cleanup of {len(self._deferred)} documents; the next run will recheck them")
+
+    def run(self, tasks) -> dict:
+        """tasks: file paths, or any picklable parse_fn arguments (may be a generator)."""
+        started = time.perf_counter()
+        self.collection_empty = self.client.count(collection_name=self.collection_name, exact=True).count == 0
+
+        if self.bulk:
+            self._run_bulk(tasks)
+        else:
+            self._phase("upload", self._stream, tasks)
+            self._delete_removed_documents()
+
+        totals = {
+            key: sum(e.get(key, 0) for e in self.summary.values())
+            for key in ("uploaded", "unchanged", "deleted", "failed")
+        }
+        print(f"\n✅ Ingested {self.task_count} tasks in {time.perf_counter() - started:.1f}s: "
+              + ", ".join(f"{v} {k}" for k, v in totals.items()))
+
+        return self.summary
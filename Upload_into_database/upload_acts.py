@@ -6,8 +6,10 @@ from dotenv import load_dotenv
 from pypdf import PdfReader
 from embedding import embeddings
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
 from langchain_qdrant import QdrantVectorStore
+from Upload_into_database.collection_config import create_legal_collection, VECTOR_SIZE
+from Upload_into_database.pipeline import IngestionPipeline, INGEST_BULK_LOAD
+from Upload_into_database.pdf_text import iter_pages
 
 
 
@@ -30,60 +32,70 @@ def ensure_collection_exists(
     collection_name: str,
     vector_size: int
 ):
-    if not client.collection_exists(collection_name):
-        client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(
-                size=vector_size,
-                distance=Distance.COSINE
-            )
-        )
+    # Quantization, on-disk and HNSW options come from collection_config
+    create_legal_collection(client, collection_name, vector_size=vector_size)
 
 
 
 # =========================
 # PDF LOADER (PAGE LIMIT SUPPORT)
 # =========================
-def load_pdf(pdf_path: str) -> str:
-    reader = PdfReader(pdf_path)
-    text = ""
+# "pymupdf" (page-parallel, see pdf_text.py) or "pypdf" (the original loader)
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pymupdf")
+
+MAX_PAGES = {
+    "Criminal_Procedure_Code_EN.pdf": 196,
+}
+
+
+def max_pages_for(pdf_path: str):
+    return next((limit for name, limit in MAX_PAGES.items() if name in pdf_path), None)
+
 
-    max_pages = None
-    if "Criminal_Procedure_Code_EN.pdf" in pdf_path:
-        max_pages = 196
+def iter_pdf_pages(pdf_path: str, workers: int = None):
+    if PDF_ENGINE == "pypdf":
+        return iter_pypdf_pages(pdf_path)
+    return iter_pages(pdf_path, end=max_pages_for(pdf_path), workers=workers)
+
+
+def iter_pypdf_pages(pdf_path: str):
+    reader = PdfReader(pdf_path)
+    max_pages = max_pages_for(pdf_path)
 
     for i, page in enumerate(reader.pages):
         if max_pages and i >= max_pages:
             break
+        yield page.extract_text()
 
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
 
-    return text
+def load_pdf(pdf_path: str) -> str:
+    return "".join(f"{page}\n" for page in iter_pdf_pages(pdf_path) if page)
 
 
 # =========================
 # CHAPTER + SECTION EXTRACTION
 # =========================
+CHAPTER_PATTERN = re.compile(
+    r"Chapter\s*[-–]\s*(\d+)\s*\n\s*(.+)",
+    re.IGNORECASE
+)
+
+SECTION_PATTERN = re.compile(
+    r'^\s*(\d+)\.\s*([^:]+):',
+    re.MULTILINE
+)
+
+HEADING_OVERLAP = 200
+
+
 def extract_chapters_and_sections(
     text: str,
     law_name: str,
     document_name: str
 ) -> List[Dict]:
 
-    chapter_pattern = re.compile(
-        r"Chapter\s*[-–]\s*(\d+)\s*\n\s*(.+)",
-        re.IGNORECASE
-    )
-
-    section_pattern = re.compile(
-        r'^\s*(\d+)\.\s*([^:]+):',
-        re.MULTILINE
-    )
-
     chunks = []
-    chapters = list(chapter_pattern.finditer(text))
+    chapters = list(CHAPTER_PATTERN.finditer(text))
 
     for i, ch in enumerate(chapters):
         start = ch.end()
@@ -93,7 +105,7 @@ def extract_chapters_and_sections(
         chapter_number = ch.group(1)
         chapter_title = ch.group(2).strip()
 
-        sections = list(section_pattern.finditer(chapter_text))
+        sections = list(SECTION_PATTERN.finditer(chapter_text))
 
         for j, sec in enumerate(sections):
             sec_start = sec.end()
@@ -118,16 +130,42 @@ def extract_chapters_and_sections(
 
     return chunks
 
+def stream_chapters_and_sections(pages, law_name: str, document_name: str):
+    """
+    Same chunks as extract_chapters_and_sections, produced chapter by chapter
+    from a page stream. Only the text since the last chapter heading is held;
+    a chapter is split off once the next heading shows up.
+    """
+    tail = ""
+    first = None  # offset of the heading tail starts with, once one is seen
+
+    for page in pages:
+        if not page:
+            continue
+        # Only rescan the new page, plus enough overlap for a heading split across pages
+        scan_from = max(len(tail) - HEADING_OVERLAP, 0)
+        tail += page + "\n"
+
+        starts = [m.start() for m in CHAPTER_PATTERN.finditer(tail, scan_from) if m.start() != first]
+        if first is None and starts:
+            first = starts.pop(0)
+
+        if starts:
+            cut = starts[-1]
+            yield from extract_chapters_and_sections(tail[:cut], law_name, document_name)
+            tail, first = tail[cut:], 0
+
+    yield from extract_chapters_and_sections(tail, law_name, document_name)
+
+
 def get_vector_store() -> QdrantVectorStore:
     """
     Ensures collection exists and returns vector store
     """
-    vector_size = 1024
-
     ensure_collection_exists(
         client=qdrant,
         collection_name=COLLECTION_NAME,
-        vector_size=vector_size
+        vector_size=VECTOR_SIZE
     )
 
     return QdrantVectorStore(
@@ -138,51 +176,37 @@ def get_vector_store() -> QdrantVectorStore:
 
 
 # =========================
-# INGEST FROM API (MAIN ENTRY)
+# PARSE (RUNS IN WORKER PROCESSES)
 # =========================
-def ingest_act_pdfs(pdf_paths: List[str]) -> dict:
-    """
-    pdf_paths: absolute or relative paths provided by API
-    """
-    vector_store = get_vector_store()
-    all_texts = []
-    all_metadatas = []
-    summary = {}
-
-    for pdf_path in pdf_paths:
-        document_name = os.path.basename(pdf_path)
-        law_name = os.path.splitext(document_name)[0].replace("_", " ")
-
-        print(f"\n📘 Processing: {document_name}")
-
-        text = load_pdf(pdf_path)
-
-        chunks = extract_chapters_and_sections(
-            text=text,
-            law_name=law_name,
-            document_name=document_name
-        )
+def parse_act_pdf(pdf_path: str):
+    document_name = os.path.basename(pdf_path)
+    law_name = os.path.splitext(document_name)[0].replace("_", " ")
 
-        for c in chunks:
-            all_texts.append(c["text"])
-            all_metadatas.append(c["metadata"])
+    chunks = list(stream_chapters_and_sections(
+        iter_pdf_pages(pdf_path),
+        law_name=law_name,
+        document_name=document_name
+    ))
+    chapter_count = Counter(c["metadata"]["chapter_number"] for c in chunks)
 
-        chapter_count = Counter(c["metadata"]["chapter_number"] for c in chunks)
+    return document_name, chunks, {"chapters": len(chapter_count)}
 
-        summary[document_name] = {
-            "chapters": len(chapter_count),
-            "sections": len(chunks)
-        }
 
-        print(f"   ➤ Chapters: {len(chapter_count)}")
-        print(f"   ➤ Sections: {len(chunks)}")
-
-    if all_texts:
-        vector_store.add_texts(
-            texts=all_texts,
-            metadatas=all_metadatas
-        )
+# =========================
+# INGEST FROM API (MAIN ENTRY)
+# =========================
+def ingest_act_pdfs(pdf_paths: List[str], bulk: bool = INGEST_BULK_LOAD) -> dict:
+    """
+    pdf_paths: absolute or relative paths provided by API
+    bulk: pause indexing for the upload, rebuild once and wait for green
 
-    print("✅ Upload complete")
+    PDFs are parsed in parallel and streamed through embedding and upload
+    in fixed-size batches, so memory stays flat as the corpus grows.
+    """
+    ensure_collection_exists(
+        client=qdrant,
+        collection_name=COLLECTION_NAME,
+        vector_size=VECTOR_SIZE
+    )
 
-    return summary
+    return IngestionPipeline(qdrant, COLLECTION_NAME, parse_act_pdf, bulk=bulk).run(pdf_paths)
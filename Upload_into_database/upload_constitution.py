@@ -1,11 +1,11 @@
-import fitz 
 import re
 from typing import List, Dict
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
-from langchain_qdrant import QdrantVectorStore
 
-from embedding import embeddings
+from constitution_index import CONSTITUTION_INDEX_DIR, export_constitution_index
+from Upload_into_database.collection_config import create_legal_collection, VECTOR_SIZE
+from Upload_into_database.pipeline import IngestionPipeline, INGEST_BULK_LOAD
+from Upload_into_database.pdf_text import iter_pages
 import os
 from dotenv import load_dotenv
 
@@ -15,6 +15,7 @@ QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "nepal_constitution"
 MAX_CONSTITUTION_PAGE = 220
+CONSTITUTION_LAW_NAME = "Constitution of Nepal 2015"
 
 
 # ==================
@@ -86,8 +87,9 @@ def split_into_articles(text: str) -> List[Dict]:
 # =========================
 # EXTRACT ARTICLES
 # =========================
-def extract_constitution_articles(pdf_path: str) -> List[Dict]:
-    doc = fitz.open(pdf_path)
+def extract_constitution_articles(pdf_path: str, workers: int = None) -> List[Dict]:
+    # Every page up to MAX_CONSTITUTION_PAGE is extracted once, in parallel
+    pages = list(iter_pages(pdf_path, end=MAX_CONSTITUTION_PAGE, workers=workers))
     all_articles = []
 
     for i, part in enumerate(toc):
@@ -95,12 +97,10 @@ def extract_constitution_articles(pdf_path: str) -> List[Dict]:
         if start_page + 1 > MAX_CONSTITUTION_PAGE:
             break
 
-        raw_end = toc[i + 1]["page"] - 1 if i + 1 < len(toc) else doc.page_count
+        raw_end = toc[i + 1]["page"] - 1 if i + 1 < len(toc) else len(pages)
         end_page = min(raw_end, MAX_CONSTITUTION_PAGE)
 
-        part_text = ""
-        for p in range(start_page, end_page):
-            part_text += doc[p].get_text()
+        part_text = "".join(pages[start_page:end_page])
 
         articles = split_into_articles(part_text)
         print(len(articles))
@@ -110,7 +110,7 @@ def extract_constitution_articles(pdf_path: str) -> List[Dict]:
                 "text": art["article_text"],
                 "metadata": {
                     "doc_type": "constitution",
-                    "law_name": "Constitution of Nepal 2015",
+                    "law_name": CONSTITUTION_LAW_NAME,
                     "part_title": part["title"],
                     "article_number": art["article_number"],
                     "article_title": art["article_title"],
@@ -123,38 +123,40 @@ def extract_constitution_articles(pdf_path: str) -> List[Dict]:
 
 
 # =========================
-# INGEST TO QDRANT
+# PARSE (RUNS IN A WORKER PROCESS)
 # =========================
-def ingest_constitution(pdf_path: str):
-    articles = extract_constitution_articles(pdf_path)
+def parse_constitution_pdf(pdf_path: str):
+    # Runs as the pipeline's only parse worker, so spread its pages across cores
+    articles = extract_constitution_articles(pdf_path, workers=os.cpu_count())
+    parts = {a["metadata"]["part_title"] for a in articles}
+    return CONSTITUTION_LAW_NAME, articles, {"parts": len(parts)}
 
-    print("article extracted....",len(articles))
-    
 
+# =========================
+# INGEST TO QDRANT
+# =========================
+def ingest_constitution(pdf_path: str, bulk: bool = INGEST_BULK_LOAD):
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY,timeout=60)
 
-    if not client.collection_exists(COLLECTION_NAME):
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(
-                size=embeddings.client.get_sentence_embedding_dimension(),
-                distance=Distance.COSINE
-            )
-        )
-    print("collection created...")
-    vector_store = QdrantVectorStore(
-        client=client,
-        collection_name=COLLECTION_NAME,
-        embedding=embeddings
-    )
-    
-    vector_store.add_texts(
-        texts=[a["text"] for a in articles],
-        metadatas=[a["metadata"] for a in articles]
-    )
+    create_legal_collection(client, COLLECTION_NAME, vector_size=VECTOR_SIZE)
+
+    # Only amended articles are re-embedded; stale ones are deleted
+    summary = IngestionPipeline(
+        client,
+        COLLECTION_NAME,
+        parse_constitution_pdf,
+        parse_workers=1,
+        document_field="metadata.law_name",
+        bulk=bulk
+    ).run([pdf_path])
+
+    # Bump the in-process index version so API workers reload it
+    if CONSTITUTION_INDEX_DIR:
+        os.makedirs(CONSTITUTION_INDEX_DIR, exist_ok=True)
+        export_constitution_index(client, CONSTITUTION_INDEX_DIR, COLLECTION_NAME)
 
     return {
         "status": "success",
-        "articles_ingested": len(articles),
+        "articles_ingested": summary.get(CONSTITUTION_LAW_NAME, {}).get("sections", 0),
         "collection": COLLECTION_NAME
     }
@@ -1,222 +1,277 @@
-# import os
-# import re
-# import uuid
-# from typing import List, Tuple
-# from docx import Document
-# from langchain_text_splitters import RecursiveCharacterTextSplitter
-# from langchain_qdrant import QdrantVectorStore
-# from sentence_transformers import SentenceTransformer
-# from qdrant_client import QdrantClient
-# from qdrant_client.models import VectorParams, Distance
-# from dotenv import load_dotenv
-# from langchain.embeddings import Embeddings
-# load_dotenv()
-
-# # =========================
-# # CONFIG
-# # =========================
-# COLLECTION_NAME = "case_laws"
-# QDRANT_URL = os.getenv("QDRANT_URL")
-# QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-
-# CASE_SPLIT_PATTERN = r"(Case:\s*\d+)"
-
-# SECTION_HEADERS = {
-#     "facts": "brief facts",
-#     "procedural_history": "procedural history",
-#     "legal_principles": "legal principles",
-#     "reasoning": "reasoning",
-#     "decision": "final decision",
-#     "summary": "case summary points"
-# }
-
-# CHUNK_CONFIG = {
-#     "facts": (600, 100),
-#     "procedural_history": (600, 100),
-#     "legal_principles": (400, 50),
-#     "reasoning": (800, 150),
-#     "decision": (1000, 0),
-#     "summary": (500, 50)
-# }
-
-# # Load the local model
-# model = SentenceTransformer('BAAI/bge-m3')  # You can replace with your preferred model
-
-
-# class LocalEmbeddings(Embeddings):
-#     """LangChain-compatible embeddings using a locally loaded model"""
-
-#     def embed_query(self, text: str):
-#         return model.encode([text])[0]  # Embeds a single query
-
-#     def embed_documents(self, texts: List[str]):
-#         return model.encode(texts)  # Embeds a list of documents
-
-
-# # =========================
-# # LOAD DOCX
-# # =========================
-# def load_docx(path: str) -> str:
-#     doc = Document(path)
-#     return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-
-
-# # =========================
-# # SPLIT CASES
-# # =========================
-# def split_cases(text: str) -> List[str]:
-#     parts = re.split(CASE_SPLIT_PATTERN, text)
-#     cases, buffer = [], ""
-
-#     for part in parts:
-#         if re.match(r"Case:\s*\d+", part.strip()):
-#             if buffer.strip():
-#                 cases.append(buffer.strip())
-#             buffer = part
-#         else:
-#             buffer += "\n" + part
-
-#     if buffer.strip():
-#         cases.append(buffer.strip())
-
-#     return cases
-
-
-# # =========================
-# # METADATA EXTRACTION
-# # =========================
-# def extract_case_metadata(text: str) -> dict:
-#     def find(pattern):
-#         m = re.search(pattern, text, re.IGNORECASE)
-#         return m.group(1).strip() if m and m.groups() else ""
-
-#     return {
-#         "doc_type": "case_law",
-#         "case_index": find(r"Case:\s*(\d+)"),
-#         "case_title": find(r"Case Title\s*:\s*(.+)"),
-#         "court": find(r"(Supreme Court[^\n]*)"),
-#         "decision_date": find(r"Decision Date\s*:\s*(.+)"),
-#         "case_no": find(r"Case No\s*:\s*(.+)"),
-#         "subject": find(r"Subject\s*:\s*(.+)")
-#     }
-
-
-# # =========================
-# # SECTION EXTRACTION
-# # =========================
-# def extract_sections(case_text: str) -> dict:
-#     sections = {}
-#     current, buffer = None, []
-
-#     for line in case_text.splitlines():
-#         line_clean = line.strip()
-#         lower = line_clean.lower()
-
-#         matched = False
-#         for key, header in SECTION_HEADERS.items():
-#             if header in lower:
-#                 if current:
-#                     sections[current] = "\n".join(buffer).strip()
-#                 current = key
-#                 buffer = []
-#                 matched = True
-#                 break
-
-#         if not matched and current:
-#             buffer.append(line_clean)
-
-#     if current:
-#         sections[current] = "\n".join(buffer).strip()
-
-#     return sections
-
-
-# # =========================
-# # CHUNKING
-# # =========================
-# def chunk_sections(sections: dict, base_metadata: dict) -> Tuple[list, list]:
-#     texts, metadatas = [], []
-
-#     for section, content in sections.items():
-#         if not content.strip():
-#             continue
-
-#         chunk_size, overlap = CHUNK_CONFIG.get(section, (600, 100))
-#         splitter = RecursiveCharacterTextSplitter(
-#             chunk_size=chunk_size,
-#             chunk_overlap=overlap
-#         )
-
-#         for idx, chunk in enumerate(splitter.split_text(content)):
-#             texts.append(chunk)
-#             metadatas.append({
-#                 **base_metadata,
-#                 "section": section,
-#                 "chunk_index": idx,
-#                 "doc_id": str(uuid.uuid4()),
-#                 "source": "case_law"
-#             })
-
-#     return texts, metadatas
-
-
-# # =========================
-# # VECTOR STORE
-# # =========================
-# def get_vector_store() -> QdrantVectorStore:
-#     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
-
-#     if not client.collection_exists(COLLECTION_NAME):
-#         client.create_collection(
-#             collection_name=COLLECTION_NAME,
-#             vectors_config=VectorParams(
-#                 size=1024,
-#                 distance=Distance.COSINE
-#             )
-#         )
-
-#     return QdrantVectorStore(
-#         client=client,
-#         collection_name=COLLECTION_NAME,
-#         embedding=LocalEmbeddings() 
-#     )
-
-
-# # =========================
-# # INGEST ENTRY POINT
-# # =========================
-# def ingest_case_docx(docx_path: str) -> dict:
-#     text = load_docx(docx_path)
-#     cases = split_cases(text)
-#     print(len(cases))
-#     vector_store = get_vector_store()
-#     total_chunks = 0
-
-#     for case_text in cases:
-#         metadata = extract_case_metadata(case_text)
-#         sections = extract_sections(case_text)
-#         texts, metas = chunk_sections(sections, metadata)
-
-#         if texts:
-#             vector_store.add_texts(texts, metadatas=metas)
-#             total_chunks += len(texts)
-#     print(total_chunks)
-#     return {
-#         "status": "success",
-#         "cases_detected": len(cases),
-#         "chunks_uploaded": total_chunks,
-#         "collection": COLLECTION_NAME
-#     }
-
-# # =========================
-# # RUN THE INGESTION FOR INDIVIDUAL FILES
-# # =========================
-# if __name__ == "__main__":
-#     docx_paths = [
-#         "./dataset/criminal-kartabya jyan.docx",
-#         "./dataset/Personal-Criminal.docx"
-#     ]
-#     for docx_path in docx_paths:
-#         print(f"Ingesting file: {docx_path}")
-#         result = ingest_case_docx(docx_path)
-#         print(result)
\ No newline at end of file
+import os
+import re
+import zipfile
+from functools import lru_cache
+from typing import List, Tuple, Iterator
+from xml.etree.ElementTree import iterparse
+from collections import defaultdict
+from dotenv import load_dotenv
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client import QdrantClient
+from Upload_into_database.collection_config import create_legal_collection, VECTOR_SIZE
+from Upload_into_database.pipeline import IngestionPipeline, INGEST_BULK_LOAD
+
+load_dotenv()
+
+# =========================
+# CONFIG
+# =========================
+COLLECTION_NAME = "case_laws"
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+CASE_SPLIT_PATTERN = re.compile(r"(Case:\s*\d+)")
+
+SECTION_HEADERS = {
+    "facts": "brief facts",
+    "procedural_history": "procedural history",
+    "legal_principles": "legal principles",
+    "reasoning": "reasoning",
+    "decision": "final decision",
+    "summary": "case summary points"
+}
+
+CHUNK_CONFIG = {
+    "facts": (600, 100),
+    "procedural_history": (600, 100),
+    "legal_principles": (400, 50),
+    "reasoning": (800, 150),
+    "decision": (1000, 0),
+    "summary": (500, 50)
+}
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+# =========================
+# STREAM DOCX
+# =========================
+def iter_paragraphs(path: str) -> Iterator[str]:
+    """
+    Body paragraphs of a DOCX in order, parsed incrementally from
+    word/document.xml instead of loading the whole document tree.
+    Table paragraphs are skipped, as python-docx's doc.paragraphs does.
+    """
+    table_depth = 0
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, elem in iterparse(xml, events=("start", "end")):
+            if elem.tag == f"{W_NS}tbl":
+                table_depth += 1 if event == "start" else -1
+            elif event == "end" and elem.tag == f"{W_NS}p":
+                if table_depth == 0:
+                    parts = []
+                    for node in elem.iter():
+                        if node.tag == f"{W_NS}t":
+                            parts.append(node.text or "")
+                        elif node.tag == f"{W_NS}tab":
+                            parts.append("\t")
+                        elif node.tag in (f"{W_NS}br", f"{W_NS}cr"):
+                            parts.append("\n")
+                    text = "".join(parts)
+                    if text.strip():
+                        yield text
+                elem.clear()
+
+
+def iter_cases(path: str) -> Iterator[str]:
+    """Yields one case at a time; text before the first "Case: N" header is ignored."""
+    buffer = None
+
+    for paragraph in iter_paragraphs(path):
+        head, *rest = CASE_SPLIT_PATTERN.split(paragraph)
+        if buffer is not None and head.strip():
+            buffer.append(head)
+
+        # rest alternates header, text following it
+        for header, body in zip(rest[::2], rest[1::2]):
+            if buffer is not None:
+                yield "\n".join(buffer).strip()
+            buffer = [header, body] if body.strip() else [header]
+
+    if buffer is not None:
+        yield "\n".join(buffer).strip()
+
+
+# =========================
+# METADATA EXTRACTION
+# =========================
+def extract_case_metadata(text: str) -> dict:
+    def find(pattern):
+        m = re.search(pattern, text, re.IGNORECASE)
+        return m.group(1).strip() if m and m.groups() else ""
+
+    return {
+        "doc_type": "case_law",
+        "case_index": find(r"Case:\s*(\d+)"),
+        "case_title": find(r"Case Title\s*:\s*(.+)"),
+        "court": find(r"(Supreme Court[^\n]*)"),
+        "decision_date": find(r"Decision Date\s*:\s*(.+)"),
+        "case_no": find(r"Case No\s*:\s*(.+)"),
+        "subject": find(r"Subject\s*:\s*(.+)")
+    }
+
+
+# =========================
+# SECTION EXTRACTION
+# =========================
+def extract_sections(case_text: str) -> dict:
+    sections = {}
+    current, buffer = None, []
+
+    for line in case_text.splitlines():
+        line_clean = line.strip()
+        lower = line_clean.lower()
+
+        matched = False
+        for key, header in SECTION_HEADERS.items():
+            if header in lower:
+                if current:
+                    sections[current] = "\n".join(buffer).strip()
+                current = key
+                buffer = []
+                matched = True
+                break
+
+        if not matched and current:
+            buffer.append(line_clean)
+
+    if current:
+        sections[current] = "\n".join(buffer).strip()
+
+    return sections
+
+
+# =========================
+# CHUNKING
+# =========================
+@lru_cache(maxsize=None)
+def splitter_for(section: str) -> RecursiveCharacterTextSplitter:
+    # One splitter per section type and worker process
+    chunk_size, overlap = CHUNK_CONFIG.get(section, (600, 100))
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+
+
+def chunk_sections(sections: dict, base_metadata: dict) -> Tuple[list, list]:
+    texts, metadatas = [], []
+
+    for section, content in sections.items():
+        if not content.strip():
+            continue
+
+        for idx, chunk in enumerate(splitter_for(section).split_text(content)):
+            texts.append(chunk)
+            metadatas.append({
+                **base_metadata,
+                "section": section,
+                "chunk_index": idx,
+                "source": "case_law"
+            })
+
+    return texts, metadatas
+
+
+# =========================
+# PARSE (RUNS IN WORKER PROCESSES)
+# =========================
+def parse_cases(document_name: str, cases) -> list:
+    """(case_key, case_text) pairs -> one pipeline document per case."""
+    documents = []
+
+    for case_key, case_text in cases:
+        metadata = extract_case_metadata(case_text)
+        metadata.update(document_name=document_name, case_key=case_key)
+
+        texts, metas = chunk_sections(extract_sections(case_text), metadata)
+        chunks = [{"text": t, "metadata": m} for t, m in zip(texts, metas)]
+        documents.append((case_key, chunks, {}))
+
+    return documents
+
+
+def case_source(case_key: str) -> str:
+    """The DOCX a case key ("<file>#<case number>") came from."""
+    return case_key.rsplit("#", 1)[0]
+
+
+def keyed_cases(docx_path: str) -> Iterator[Tuple[str, str]]:
+    """Streams a DOCX's cases as (case_key, case_text)."""
+    document_name = os.path.basename(docx_path)
+    seen = defaultdict(int)
+
+    for case_text in iter_cases(docx_path):
+        # "<file>#<case number>", suffixed if a number repeats within the file
+        case_index = re.match(r"Case:\s*(\d+)", case_text).group(1)
+        seen[case_index] += 1
+        case_key = f"{document_name}#{case_index}"
+        if seen[case_index] > 1:
+            case_key += f"~{seen[case_index]}"
+        yield case_key, case_text
+
+
+def parse_docx(docx_path: str) -> list:
+    """
+    One pipeline task per DOCX: unzipping, XML parsing and chunking all run
+    in the worker, and a corrupt file fails only its own task.
+    """
+    document_name = os.path.basename(docx_path)
+    documents = parse_cases(document_name, keyed_cases(docx_path))
+    print(f"📘 Parsed {len(documents)} cases from {document_name}")
+    return documents
+
+
+# =========================
+# INGEST ENTRY POINT
+# =========================
+def ingest_case_docx(docx_paths: List[str], bulk: bool = INGEST_BULK_LOAD) -> dict:
+    if isinstance(docx_paths, str):
+        docx_paths = [docx_paths]
+
+    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
+    create_legal_collection(client, COLLECTION_NAME, vector_size=VECTOR_SIZE)
+
+    pipeline = IngestionPipeline(
+        client,
+        COLLECTION_NAME,
+        parse_docx,
+        document_field="metadata.case_key",
+        # Stored cases are looked up (and removed ones deleted) per DOCX
+        source_field="metadata.document_name",
+        source_of=case_source,
+        bulk=bulk,
+        log_documents=False
+    )
+    summary = pipeline.run(docx_paths)
+
+    # Roll the per-case entries up per DOCX
+    per_file = defaultdict(lambda: defaultdict(int))
+    for case_key, entry in summary.items():
+        document_name = case_source(case_key)
+        if "error" in entry:
+            per_file[document_name]["failed_tasks"] += 1
+            continue
+        if entry.get("removed"):
+            per_file[document_name]["cases_removed"] += 1
+            per_file[document_name]["deleted"] += entry["deleted"]
+            continue
+
+        per_file[document_name]["cases_detected"] += 1
+        per_file[document_name]["chunks"] += entry["sections"]
+        for key in ("uploaded", "unchanged", "deleted", "failed"):
+            per_file[document_name][key] += entry[key]
+
+    return {
+        "status": "success",
+        "files": {name: dict(counts) for name, counts in per_file.items()},
+        "collection": COLLECTION_NAME
+    }
+
+
+# =========================
+# RUN THE INGESTION FOR INDIVIDUAL FILES
+# =========================
+if __name__ == "__main__":
+    docx_paths = [
+        "./dataset/criminal-kartabya jyan.docx",
+        "./dataset/Personal-Criminal.docx"
+    ]
+    print(ingest_case_docx(docx_paths))
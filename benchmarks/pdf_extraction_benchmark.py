@@ -0,0 +1,86 @@
+"""
+Statute PDF extraction: the original pypdf loader vs the PyMuPDF page-parallel layer.
+
+    python -m benchmarks.pdf_extraction_benchmark data/Criminal_Procedure_Code_EN.pdf --workers 8
+
+Each mode is timed end to end (extraction + chapter/section splitting), and
+the number of sections is reported so a change in extracted text shows up.
+"""
+import os
+import sys
+import time
+import argparse
+from pypdf import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Upload_into_database.pdf_text import iter_pages
+from Upload_into_database.upload_acts import (
+    max_pages_for,
+    extract_chapters_and_sections,
+    stream_chapters_and_sections,
+)
+
+
+def pypdf_baseline(pdf_path: str) -> list:
+    # The loader as it was: pypdf with a growing string
+    reader = PdfReader(pdf_path)
+    text = ""
+    max_pages = max_pages_for(pdf_path)
+
+    for i, page in enumerate(reader.pages):
+        if max_pages and i >= max_pages:
+            break
+        page_text = page.extract_text()
+        if page_text:
+            text += page_text + "\n"
+
+    return extract_chapters_and_sections(text, "bench", os.path.basename(pdf_path))
+
+
+def pymupdf_joined(pdf_path: str, workers: int) -> list:
+    pages = iter_pages(pdf_path, end=max_pages_for(pdf_path), workers=workers)
+    text = "".join(f"{page}\n" for page in pages if page)
+    return extract_chapters_and_sections(text, "bench", os.path.basename(pdf_path))
+
+
+def pymupdf_streamed(pdf_path: str, workers: int) -> list:
+    pages = iter_pages(pdf_path, end=max_pages_for(pdf_path), workers=workers)
+    return list(stream_chapters_and_sections(pages, "bench", os.path.basename(pdf_path)))
+
+
+def best_of(fn, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run(pdf_paths: list, workers: int, repeats: int):
+    modes = {
+        "pypdf (current)": lambda p: pypdf_baseline(p),
+        "pymupdf serial": lambda p: pymupdf_joined(p, 1),
+        f"pymupdf x{workers}": lambda p: pymupdf_joined(p, workers),
+        f"pymupdf x{workers} streamed": lambda p: pymupdf_streamed(p, workers),
+    }
+
+    for pdf_path in pdf_paths:
+        print(f"\n📘 {os.path.basename(pdf_path)} (max pages: {max_pages_for(pdf_path) or 'all'})")
+        baseline = None
+        for mode, fn in modes.items():
+            seconds, chunks = best_of(lambda: fn(pdf_path), repeats)
+            baseline = baseline or seconds
+            print(f"   ➤ {mode:26s} {seconds * 1000:8.1f}ms  x{baseline / seconds:5.2f}  "
+                  f"sections={len(chunks)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.pdfs, args.workers, args.repeats)
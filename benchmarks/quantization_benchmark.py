@@ -0,0 +1,125 @@
+"""
+Quantized vs exact search on a legal collection.
+
+    python -m benchmarks.quantization_benchmark nepal_acts --queries questions.txt -k 5
+
+Queries default to the questions logged in CLASSIFIER_LOG_PATH. The exact
+baseline ignores quantization and HNSW (SearchParams(exact=True)), so recall@k
+measures what the configured index + quantization loses against brute force.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams, QuantizationSearchParams
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding import embeddings
+from local_classifier import CLASSIFIER_LOG_PATH
+
+load_dotenv()
+
+
+def load_queries(path: str, limit: int) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            queries = [json.loads(line)["question"] for line in f if line.strip()]
+        else:
+            queries = [line.strip() for line in f if line.strip()]
+    return list(dict.fromkeys(queries))[:limit]
+
+
+def estimate_memory(info) -> dict:
+    """Rough RAM/disk split from the collection config; Qdrant does not report it directly."""
+    vectors = info.config.params.vectors
+    hnsw = info.config.hnsw_config
+    quantization = info.config.quantization_config
+    count = info.points_count or 0
+    dim = vectors.size
+
+    original = count * dim * 4
+    links = count * hnsw.m * 2 * 8
+    quantized = 0
+    if quantization is not None and getattr(quantization, "scalar", None):
+        quantized = count * dim
+    elif quantization is not None and getattr(quantization, "binary", None):
+        quantized = count * dim // 8
+
+    ram = links + quantized + (0 if vectors.on_disk else original)
+    return {
+        "points": count,
+        "original_vectors_mb": round(original / 2**20, 1),
+        "quantized_vectors_mb": round(quantized / 2**20, 1),
+        "hnsw_links_mb": round(links / 2**20, 1),
+        "estimated_ram_mb": round(ram / 2**20, 1),
+        "on_disk": bool(vectors.on_disk),
+    }
+
+
+def timed_search(client, collection_name: str, query_vecs, k: int, params, repeats: int):
+    latencies = []
+    ids = []
+    for vec in query_vecs:
+        for i in range(repeats):
+            start = time.perf_counter()
+            result = client.query_points(
+                collection_name=collection_name,
+                query=vec,
+                limit=k,
+                search_params=params,
+                with_payload=False
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([p.id for p in result.points])
+    return ids, np.asarray(latencies)
+
+
+def recall_at_k(found, expected) -> float:
+    hits = [len(set(f) & set(e)) / max(len(e), 1) for f, e in zip(found, expected)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def run(collection_name: str, queries: list[str], k: int, repeats: int, oversampling: float):
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+    query_vecs = embeddings.embed_documents(queries).tolist()
+
+    modes = {
+        "exact": SearchParams(exact=True),
+        "hnsw_unquantized": SearchParams(quantization=QuantizationSearchParams(ignore=True)),
+        "quantized_rescore": SearchParams(
+            quantization=QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        ),
+        "quantized_no_rescore": SearchParams(quantization=QuantizationSearchParams(rescore=False)),
+    }
+
+    print(f"📊 {collection_name}: {len(queries)} queries, k={k}, repeats={repeats}")
+    print(json.dumps(estimate_memory(client.get_collection(collection_name)), indent=2))
+
+    baseline = None
+    for mode, params in modes.items():
+        ids, latencies = timed_search(client, collection_name, query_vecs, k, params, repeats)
+        if baseline is None:
+            baseline = ids
+        print(
+            f"   ➤ {mode:22s} p50={np.percentile(latencies, 50):7.1f}ms "
+            f"p99={np.percentile(latencies, 99):7.1f}ms "
+            f"recall@{k}={recall_at_k(ids, baseline):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collection")
+    parser.add_argument("--queries", default=CLASSIFIER_LOG_PATH)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    args = parser.parse_args()
+
+    run(args.collection, load_queries(args.queries, args.limit), args.k, args.repeats, args.oversampling)
@@ -0,0 +1,125 @@
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from langchain_qdrant import QdrantVectorStore
+from embedding import embeddings
+from Upload_into_database.collection_config import ensure_payload_indexes
+
+load_dotenv()
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+CONSTITUTION_COLLECTION = "nepal_constitution"
+ACTS_COLLECTION = "nepal_acts"
+CASES_COLLECTION = "case_laws"
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", 30))
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+# =========================
+# CLIENT REGISTRY
+# =========================
+class Clients:
+    """Qdrant, vector store and Groq clients shared by every request of a worker."""
+
+    def __init__(self):
+        qdrant_args = dict(
+            url=os.getenv("QDRANT_URL"),
+            api_key=os.getenv("QDRANT_API_KEY"),
+            timeout=QDRANT_TIMEOUT,
+            limits=http_limits()
+        )
+        groq_args = dict(
+            api_key=os.getenv("GROQ_API_KEY"),
+            base_url=GROQ_BASE_URL
+        )
+
+        # Sync clients serve scripts and the sync pipeline,
+        # async ones serve the FastAPI request path
+        self.qdrant = QdrantClient(**qdrant_args)
+        self.aqdrant = AsyncQdrantClient(**qdrant_args)
+
+        self.groq = OpenAI(**groq_args, http_client=DefaultHttpxClient(limits=http_limits()))
+        self.agroq = AsyncOpenAI(**groq_args, http_client=DefaultAsyncHttpxClient(limits=http_limits()))
+
+        self.constitution_store = QdrantVectorStore(
+            client=self.qdrant,
+            collection_name=CONSTITUTION_COLLECTION,
+            embedding=embeddings
+        )
+        self.case_store = QdrantVectorStore(
+            client=self.qdrant,
+            collection_name=CASES_COLLECTION,
+            embedding=embeddings
+        )
+        self.act_store = QdrantVectorStore(
+            client=self.qdrant,
+            collection_name=ACTS_COLLECTION,
+            embedding=embeddings
+        )
+
+    def bootstrap_indexes(self):
+        # Field lists live in collection_config.PAYLOAD_INDEXES, shared with ingestion
+        for collection_name in (CONSTITUTION_COLLECTION, ACTS_COLLECTION, CASES_COLLECTION):
+            ensure_payload_indexes(self.qdrant, collection_name)
+
+    def close(self):
+        self.groq.close()
+        self.qdrant.close()
+
+    async def aclose(self):
+        await self.agroq.close()
+        await self.aqdrant.close()
+        self.close()
+
+
+_clients = None
+_lock = threading.Lock()
+
+
+def get_clients() -> Clients:
+    """
+    Returns the worker's clients, creating them on first use so scripts
+    that never go through the FastAPI lifespan still work.
+    """
+    global _clients
+    if _clients is None:
+        with _lock:
+            if _clients is None:
+                clients = Clients()
+                clients.bootstrap_indexes()
+                _clients = clients
+    return _clients
+
+
+def startup():
+    get_clients()
+
+
+def shutdown():
+    global _clients
+    with _lock:
+        if _clients is not None:
+            _clients.close()
+            _clients = None
+
+
+async def ashutdown():
+    global _clients
+    clients, _clients = _clients, None
+    if clients is not None:
+        await clients.aclose()
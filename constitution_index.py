@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+load_dotenv()
+
+# Empty disables the in-process backend and every search goes to Qdrant
+CONSTITUTION_INDEX_DIR = os.getenv("CONSTITUTION_INDEX_DIR", "")
+RELOAD_CHECK_SECONDS = float(os.getenv("CONSTITUTION_INDEX_RELOAD_SECONDS", 30))
+COLLECTION_NAME = "nepal_constitution"
+
+
+# =========================
+# EXPORT
+# =========================
+def export_constitution_index(client, index_dir: str = CONSTITUTION_INDEX_DIR,
+                              collection_name: str = COLLECTION_NAME) -> str:
+    """
+    Dumps the collection's vectors and payloads into <index_dir>/<version>/
+    and points <index_dir>/CURRENT at it. The version is a hash of the corpus,
+    so re-exporting an unchanged collection is a no-op for running workers.
+    """
+    points = []
+    offset = None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection_name,
+            with_payload=True,
+            with_vectors=True,
+            limit=256,
+            offset=offset
+        )
+        points.extend(batch)
+        if offset is None:
+            break
+
+    points.sort(key=lambda p: str(p.id))
+    matrix = np.asarray([p.vector for p in points], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    vectors = matrix.astype(np.float16)
+
+    # Ids, full payloads and the exported vectors, so a re-embed or a
+    # metadata change produces a new version
+    digest = hashlib.sha256(vectors.tobytes())
+    for p in points:
+        digest.update(str(p.id).encode("utf-8"))
+        digest.update(json.dumps(p.payload, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    version = digest.hexdigest()[:16]
+
+    version_dir = os.path.join(index_dir, version)
+    if not os.path.exists(version_dir):
+        tmp_dir = f"{version_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        vectors.tofile(os.path.join(tmp_dir, "vectors.f16"))
+        with open(os.path.join(tmp_dir, "payloads.json"), "w", encoding="utf-8") as f:
+            json.dump([{"id": str(p.id), "payload": p.payload} for p in points], f)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"collection": collection_name, "count": len(points), "dim": matrix.shape[1]}, f)
+
+        os.replace(tmp_dir, version_dir)
+
+    # Atomic marker swap; workers pick it up on their next reload check
+    marker_tmp = os.path.join(index_dir, f"CURRENT.tmp-{os.getpid()}")
+    with open(marker_tmp, "w") as f:
+        f.write(version)
+    os.replace(marker_tmp, os.path.join(index_dir, "CURRENT"))
+
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name not in (version, "CURRENT") and os.path.isdir(path) and ".tmp-" not in name:
+            shutil.rmtree(path, ignore_errors=True)
+
+    print(f"✅ Exported {len(points)} constitution vectors as version {version}")
+    return version
+
+
+# =========================
+# IN-PROCESS SEARCH
+# =========================
+class ConstitutionIndex:
+    """
+    Exact search over the memory-mapped constitution export. The float16
+    matrix is mapped read-only, so all uvicorn workers share the same pages.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.version = None
+        # (matrix, entries, article_numbers), swapped as one on reload
+        self._state = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _load(self, version: str):
+        version_dir = os.path.join(self.index_dir, version)
+        with open(os.path.join(version_dir, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(version_dir, "payloads.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+
+        matrix = np.memmap(
+            os.path.join(version_dir, "vectors.f16"),
+            dtype=np.float16,
+            mode="r",
+            shape=(meta["count"], meta["dim"])
+        )
+
+        article_numbers = np.asarray(
+            [str((e["payload"].get("metadata") or {}).get("article_number")) for e in entries]
+        )
+        self._state = (matrix, entries, article_numbers)
+        self.version = version
+        print(f"[CONSTITUTION INDEX] loaded version {version} ({meta['count']} vectors)")
+
+    def _maybe_reload(self):
+        # Also rate-limited while nothing is loaded, so a missing export
+        # does not cost a file read on every search
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            version = self._current_version()
+            if version and version != self.version:
+                try:
+                    self._load(version)
+                except (OSError, ValueError) as e:
+                    print(f"[CONSTITUTION INDEX] failed to load {version}: {e}")
+
+    @staticmethod
+    def _document(entry: dict) -> Document:
+        metadata = dict(entry["payload"].get("metadata") or {})
+        metadata["_id"] = entry["id"]
+        metadata["_collection_name"] = COLLECTION_NAME
+        return Document(page_content=entry["payload"].get("page_content", ""), metadata=metadata)
+
+    def search(self, query_vec, k: int, article_number: str = None):
+        """
+        Top-k documents by cosine similarity, restricted to article_number
+        when that article exists. Returns None if no export is loaded.
+        """
+        self._maybe_reload()
+        if self._state is None:
+            return None
+        matrix, entries, article_numbers = self._state
+
+        query_vec = np.asarray(query_vec, dtype=np.float32).ravel()
+        query_vec = query_vec / max(np.linalg.norm(query_vec), 1e-12)
+        scores = matrix @ query_vec
+
+        rows = np.arange(len(scores))
+        if article_number is not None:
+            matching = rows[article_numbers == article_number]
+            if len(matching):
+                rows = matching
+
+        top = rows[np.argsort(-scores[rows], kind="stable")[:k]]
+        return [self._document(entries[int(r)]) for r in top]
+
+
+constitution_index = ConstitutionIndex(CONSTITUTION_INDEX_DIR) if CONSTITUTION_INDEX_DIR else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export" and CONSTITUTION_INDEX_DIR:
+        from qdrant_client import QdrantClient
+
+        os.makedirs(CONSTITUTION_INDEX_DIR, exist_ok=True)
+        export_constitution_index(
+            QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+        )
+    else:
+        print("usage: CONSTITUTION_INDEX_DIR=<dir> python constitution_index.py export")
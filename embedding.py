@@ -1,7 +1,17 @@
 import os
+import time
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
 from dotenv import load_dotenv
 from huggingface_hub import InferenceClient
+from huggingface_hub.errors import HfHubHTTPError
 from langchain_core.embeddings import Embeddings
+import metrics
+from embedding_store import EmbeddingStore
 
 load_dotenv()
 
@@ -13,15 +23,203 @@ hf_client = InferenceClient(
 )
 
 MODEL_NAME = "BAAI/bge-m3"
+QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", 1024))
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", 4))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", 1.0))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Persistent (model, sha256(text)) -> float16 vector store; opt-in, e.g. ".embedding_store"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "")
+# ~2 KB per bge-m3 row, so the default caps the store at about 1 GB
+EMBEDDING_STORE_MAX_ROWS = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", 500000))
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", 5))
+EMBED_MICRO_BATCH_MAX = int(os.getenv("EMBED_MICRO_BATCH_MAX", 32))
+
+
+# =========================
+# BATCHED FEATURE EXTRACTION
+# =========================
+def _retry_delay(error: HfHubHTTPError, attempt: int) -> float:
+    retry_after = error.response.headers.get("Retry-After") if error.response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return EMBED_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, EMBED_BACKOFF_SECONDS)
+
+
+def embed_batch(texts: list[str]) -> np.ndarray:
+    """One feature_extraction call for a list of texts, retried on rate limits."""
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            vectors = hf_client.feature_extraction(texts, model=MODEL_NAME)
+            return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        except HfHubHTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in RETRYABLE_STATUS or attempt == EMBED_MAX_RETRIES:
+                raise
+
+            delay = _retry_delay(e, attempt)
+            print(f"[EMBED] HTTP {status}, retrying batch of {len(texts)} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+# =========================
+# QUERY MICRO-BATCHER
+# =========================
+class EmbeddingMicroBatcher:
+    """
+    Collects embed_query calls arriving within window_ms (or until
+    max_batch texts are queued) and sends them as one batched
+    feature_extraction call, resolving each caller with its own vector.
+    """
+
+    def __init__(self, embedder, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = EMBED_MICRO_BATCH_MAX):
+        self._embedder = embedder
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        # The loop only holds weak references to tasks; keep in-flight batches alive
+        self._tasks = set()
+
+    async def embed_query(self, text: str):
+        vec = self._embedder.cached_query(text)
+        if vec is not None:
+            return vec
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            metrics.observe("embed_batcher.queue_wait_ms", (started - enqueued) * 1000)
+        metrics.observe("embed_batcher.batch_size", len(batch))
+
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await asyncio.to_thread(self._embedder.embed_queries, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(by_text[text])
 
 
 class HFHostedEmbeddings(Embeddings):
     """LangChain-compatible embeddings using HF Inference API"""
 
+    def __init__(self, query_cache_size: int = QUERY_CACHE_SIZE):
+        # Bounded LRU of recent query embeddings, shared across requests
+        self._query_cache = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._query_cache_lock = threading.Lock()
+        self._batcher = None
+
+    def cached_query(self, text: str):
+        with self._query_cache_lock:
+            vec = self._query_cache.get(text)
+            if vec is not None:
+                self._query_cache.move_to_end(text)
+            return vec
+
+    def _remember_query(self, text: str, vec: np.ndarray):
+        # Cached arrays are handed to every caller, keep them immutable
+        vec.setflags(write=False)
+
+        with self._query_cache_lock:
+            self._query_cache[text] = vec
+            self._query_cache.move_to_end(text)
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+
     def embed_query(self, text: str):
-        return hf_client.feature_extraction(text, model=MODEL_NAME)
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: list[str]) -> list:
+        """Embeds several queries with one batched call, going through the LRU and store."""
+        vectors = [self.cached_query(t) for t in texts]
+        missing = [t for t, v in zip(texts, vectors) if v is None]
+
+        if missing:
+            fresh = dict(zip(missing, self._lookup_or_embed(missing)))
+            for text, vec in fresh.items():
+                self._remember_query(text, vec)
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+
+        return vectors
+
+    def _lookup_or_embed(self, texts: list[str], batch_size: int = None, max_workers: int = None) -> list:
+        stored = embedding_store.get_many(texts) if embedding_store else [None] * len(texts)
+        missing = [i for i, v in enumerate(stored) if v is None]
 
-    def embed_documents(self, texts: list[str]):
-        return [hf_client.feature_extraction(t, model=MODEL_NAME) for t in texts]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = self._embed_remote(missing_texts, batch_size, max_workers)
+            if embedding_store:
+                embedding_store.put_many(missing_texts, fresh)
+            for i, vec in zip(missing, fresh):
+                stored[i] = vec
+
+        return stored
+
+    def _embed_remote(self, texts: list[str], batch_size: int = None, max_workers: int = None) -> np.ndarray:
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        max_workers = max_workers or EMBED_MAX_WORKERS
+
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if len(batches) == 1:
+            return embed_batch(batches[0])
+
+        # pool.map keeps batch order, so rows line up with the input texts
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            return np.vstack(list(pool.map(embed_batch, batches)))
+
+    async def aembed_query(self, text: str):
+        if self._batcher is None:
+            self._batcher = EmbeddingMicroBatcher(self)
+        return await self._batcher.embed_query(text)
+
+    def embed_documents(self, texts: list[str], batch_size: int = None, max_workers: int = None):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Unchanged texts come straight from the store, only new ones hit the API
+        return np.vstack(self._lookup_or_embed(texts, batch_size, max_workers))
+
+embedding_store = (
+    EmbeddingStore(EMBEDDING_STORE_DIR, MODEL_NAME, EMBEDDING_STORE_MAX_ROWS)
+    if EMBEDDING_STORE_DIR else None
+)
 
 embeddings = HFHostedEmbeddings()
@@ -0,0 +1,179 @@
+import os
+import json
+import fcntl
+import struct
+import hashlib
+import threading
+import numpy as np
+
+# sha256(text) digest -> row number in the vector file
+INDEX_RECORD = struct.Struct("<32sQ")
+
+
+class EmbeddingStore:
+    """
+    On-disk, content-addressed embedding store for one model.
+
+    vectors.f16 holds packed float16 rows and is read through a memory map.
+    index.bin is an append-only log of (sha256(text), row) records that is
+    only written after the rows it points at, so readers never need a lock.
+    Writers from any process serialize on an flock of store.lock.
+
+    There is no eviction: once max_rows vectors are stored, new texts are
+    embedded as usual but no longer persisted. Writes are not fsynced; after
+    a crash the store may lose its newest rows, which are then re-embedded.
+    """
+
+    def __init__(self, root: str, model_name: str, max_rows: int):
+        # Created on first write, so importing the module touches no files
+        self.dir = os.path.join(root, model_name.replace("/", "__"))
+
+        self.model_name = model_name
+        self.max_rows = max_rows
+        self._full = False
+        self._vectors_path = os.path.join(self.dir, "vectors.f16")
+        self._index_path = os.path.join(self.dir, "index.bin")
+        self._meta_path = os.path.join(self.dir, "meta.json")
+        self._lock_path = os.path.join(self.dir, "store.lock")
+
+        self._rows = {}
+        self._index_offset = 0
+        self._dim = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    # =========================
+    # READ PATH
+    # =========================
+    def _load_dim(self):
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self._dim = json.load(f)["dim"]
+        return self._dim
+
+    def _refresh_index(self):
+        # Pick up records appended by other processes since the last read
+        try:
+            with open(self._index_path, "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        for digest, row in INDEX_RECORD.iter_unpack(data[:usable]):
+            self._rows[digest] = row
+        self._index_offset += usable
+
+    def _vectors(self, min_rows: int) -> np.ndarray:
+        if self._map is None or self._map.shape[0] < min_rows:
+            rows = os.path.getsize(self._vectors_path) // (self._dim * 2)
+            self._map = np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(rows, self._dim))
+        return self._map
+
+    def get_many(self, texts: list[str]) -> list:
+        """Returns a float32 vector per text, or None where the text is not stored."""
+        digests = [self.key(t) for t in texts]
+
+        with self._lock:
+            if any(d not in self._rows for d in digests):
+                self._refresh_index()
+
+            rows = [self._rows.get(d) for d in digests]
+            found = [r for r in rows if r is not None]
+            if not found or self._load_dim() is None:
+                return [None] * len(texts)
+
+            matrix = self._vectors(max(found) + 1)
+            vectors = []
+            for r in rows:
+                # Without fsync an index record can outlive its row across a crash
+                vec = np.asarray(matrix[r], dtype=np.float32) if r is not None and r < matrix.shape[0] else None
+                vectors.append(None if vec is None or np.isnan(vec[0]) else vec)
+            return vectors
+
+    # =========================
+    # WRITE PATH
+    # =========================
+    def _ensure_dim(self, dim: int):
+        if self._load_dim() is None:
+            with open(self._meta_path, "w") as f:
+                json.dump({"model": self.model_name, "dim": dim}, f)
+            self._dim = dim
+        elif self._dim != dim:
+            raise ValueError(f"Embedding store {self.dir} holds {self._dim}-dim vectors, got {dim}")
+
+    def _readable(self, digest: bytes, stored_rows: int) -> bool:
+        row = self._rows.get(digest)
+        if row is None or row >= stored_rows:
+            return False
+        return not np.isnan(self._vectors(stored_rows)[row, 0])
+
+    def put_many(self, texts: list[str], vectors):
+        if self._full:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16).reshape(len(texts), -1)
+
+        os.makedirs(self.dir, exist_ok=True)
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                self._ensure_dim(vectors.shape[1])
+
+                row_bytes = self._dim * 2
+                size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+                # Drop a torn row left by a writer that crashed mid-append
+                if size % row_bytes:
+                    size -= size % row_bytes
+                    os.truncate(self._vectors_path, size)
+                start_row = size // row_bytes
+
+                new = {}
+                for text, vec in zip(texts, vectors):
+                    digest = self.key(text)
+                    # A digest whose row was lost in a crash is stored again; its
+                    # new index record supersedes the old one in _refresh_index
+                    if not self._readable(digest, start_row) and digest not in new:
+                        new[digest] = vec
+                if not new:
+                    return
+
+                # Unsynced rows lost in a crash may still be indexed; pad them with NaN
+                # (read back as missing) so new rows never take their row numbers
+                indexed_rows = max(self._rows.values(), default=-1) + 1
+                if indexed_rows > start_row:
+                    with open(self._vectors_path, "ab") as f:
+                        f.write(np.full((indexed_rows - start_row, self._dim), np.nan, dtype=np.float16).tobytes())
+                    start_row = indexed_rows
+
+                room = self.max_rows - start_row
+                if room <= 0:
+                    self._full = True
+                    print(f"[EMBED] Embedding store {self.dir} is full ({self.max_rows} rows), no longer persisting")
+                    return
+                if len(new) > room:
+                    new = dict(list(new.items())[:room])
+
+                with open(self._vectors_path, "ab") as f:
+                    f.write(np.stack(list(new.values())).tobytes())
+
+                records = [(digest, start_row + i) for i, digest in enumerate(new)]
+                index_size = os.path.getsize(self._index_path) if os.path.exists(self._index_path) else 0
+                if index_size % INDEX_RECORD.size:
+                    os.truncate(self._index_path, index_size - index_size % INDEX_RECORD.size)
+                    self._index_offset = min(self._index_offset, index_size - index_size % INDEX_RECORD.size)
+
+                with open(self._index_path, "ab") as f:
+                    f.write(b"".join(INDEX_RECORD.pack(d, r) for d, r in records))
+                    f.flush()
+
+                # We refreshed to EOF under the flock, so these are the next records
+                self._index_offset += len(records) * INDEX_RECORD.size
+                self._rows.update(records)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,145 @@
+import os
+import re
+import sys
+import json
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Labels produced by the Groq classifier are appended here and used as
+# training data for the local TF-IDF model
+CLASSIFIER_LOG_PATH = os.getenv("CLASSIFIER_LOG_PATH", "classifier_labels.jsonl")
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", "classifier_model.joblib")
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", 0.85))
+
+ARTICLE_PATTERN = re.compile(r"\barticle\s+(\d+)")
+SECTION_PATTERN = re.compile(r"\bsection\s+(\d+)")
+
+# Only explicit requests for a lawyer: "recommend me a lawyer", "need an advocate"
+LAWYER_REQUEST_PATTERN = re.compile(
+    r"\b(recommend|suggest|find|need|want|hire|looking for)\s+(me\s+)?"
+    r"(a|an|some|good|the best|a good)\s+(\w+\s+)?(lawyers?|advocates?|attorneys?|legal counsel)\b"
+)
+# "my lawyer", "don't want to hire a lawyer" and statute references are legal questions
+NOT_LAWYER_REQUEST = re.compile(
+    r"\b(my|our|his|her|their|your)\s+(\w+\s+)?(lawyers?|advocates?|attorneys?)\b"
+    r"|\b(not|no|never|don'?t|doesn'?t|didn'?t|without)\b"
+    r"|\b(article|section)\s+\d+"
+)
+
+# Words that turn a plain article/section question into something else
+NON_LOOKUP_HINTS = re.compile(
+    r"\b(courts?|cases?|precedents?|judg\w*|rulings?|interpret\w*|explain\w*|mean\w*|scope"
+    r"|appl(y|ied|ies)|violat\w*|would|will|if|could|likely)\b"
+)
+
+MAX_LOOKUP_WORDS = 10
+RULE_CONFIDENCE = 0.99
+
+_log_lock = threading.Lock()
+_model = None
+_model_loaded = False
+
+
+# =========================
+# RULES
+# =========================
+def rule_label(question: str):
+    text = question.lower().strip()
+
+    if LAWYER_REQUEST_PATTERN.search(text) and not NOT_LAWYER_REQUEST.search(text):
+        return "RECOMMENDATION"
+
+    if (ARTICLE_PATTERN.search(text) or SECTION_PATTERN.search(text)) \
+            and len(text.split()) <= MAX_LOOKUP_WORDS \
+            and not NON_LOOKUP_HINTS.search(text):
+        return "LOOKUP"
+
+    return None
+
+
+# =========================
+# TF-IDF MODEL
+# =========================
+def _load_model():
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if os.path.exists(CLASSIFIER_MODEL_PATH):
+            import joblib
+            _model = joblib.load(CLASSIFIER_MODEL_PATH)
+            print(f"[CLASSIFIER] loaded local model from {CLASSIFIER_MODEL_PATH}")
+    return _model
+
+
+def model_label(question: str):
+    """(label, confidence) from the local model, or (None, 0.0) if none is trained."""
+    model = _load_model()
+    if model is None:
+        return None, 0.0
+
+    probs = model.predict_proba([question.lower().strip()])[0]
+    best = probs.argmax()
+    return str(model.classes_[best]), float(probs[best])
+
+
+def local_label(question: str):
+    """(label, confidence, source) from the rules, falling back to the local model."""
+    label = rule_label(question)
+    if label:
+        return label, RULE_CONFIDENCE, "rule"
+
+    label, confidence = model_label(question)
+    return label, confidence, "model"
+
+
+def record_label(question: str, label: str):
+    with _log_lock, open(CLASSIFIER_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"question": question, "label": label}) + "\n")
+
+
+def train(log_path: str = CLASSIFIER_LOG_PATH, model_path: str = CLASSIFIER_MODEL_PATH):
+    import joblib
+    from sklearn.pipeline import make_pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+
+    # Last label wins for questions that were classified more than once
+    labelled = {}
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            labelled[row["question"].lower().strip()] = row["label"]
+
+    questions = list(labelled)
+    labels = [labelled[q] for q in questions]
+    print(f"📊 {len(questions)} labelled questions: {dict(Counter(labels))}")
+    if len(set(labels)) < 2:
+        print(f"❌ Need at least two distinct labels in {log_path} to train, not saving a model")
+        return
+
+    model = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1),
+        LogisticRegression(max_iter=1000, class_weight="balanced")
+    )
+
+    if len(questions) >= 50 and min(Counter(labels).values()) >= 2:
+        x_train, x_test, y_train, y_test = train_test_split(
+            questions, labels, test_size=0.2, stratify=labels, random_state=0
+        )
+        model.fit(x_train, y_train)
+        print(f"   ➤ Holdout accuracy: {model.score(x_test, y_test):.3f}")
+
+    model.fit(questions, labels)
+    joblib.dump(model, model_path)
+    print(f"✅ Saved local classifier to {model_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "train":
+        train()
+    else:
+        print("usage: python local_classifier.py train")
@@ -0,0 +1,91 @@
+import re
+from qdrant_client.models import Filter, FieldCondition, MatchAny, MatchValue
+
+# "article 16", "articles 16 and 17", "section 12, 13"
+ARTICLE_REFS = re.compile(r"\barticles?\s+(\d+(?:\s*(?:,|and|&)\s*\d+)*)")
+SECTION_REFS = re.compile(r"\bsections?\s+(\d+(?:\s*(?:,|and|&)\s*\d+)*)")
+
+# Alias -> law_name for every statute in nepal_acts, longest alias first
+_law_aliases = []
+
+
+# =========================
+# LAW NAME INDEX
+# =========================
+def _aliases(law_name: str) -> set[str]:
+    name = law_name.lower().strip()
+    aliases = {name}
+
+    # "Criminal Procedure Code EN" -> "criminal procedure code"
+    stripped = re.sub(r"\s+(en|np|english|nepali)$", "", name)
+    aliases.add(stripped)
+    # "Labour Act 2017" / "Labour Act, 2074" -> "labour act"
+    aliases.add(re.sub(r",?\s*\(?\d{4}\)?$", "", stripped).strip())
+
+    return {a for a in aliases if len(a) > 3}
+
+
+def load_law_names(client, collection_name: str = "nepal_acts"):
+    """Builds the alias index from the law_name payloads stored in Qdrant."""
+    global _law_aliases
+
+    law_names = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            with_payload=["metadata.law_name"],
+            with_vectors=False,
+            limit=1000,
+            offset=offset
+        )
+        for point in points:
+            law_name = (point.payload.get("metadata") or {}).get("law_name")
+            if law_name:
+                law_names.add(law_name)
+        if offset is None:
+            break
+
+    aliases = {alias: law for law in law_names for alias in _aliases(law)}
+    _law_aliases = sorted(aliases.items(), key=lambda kv: len(kv[0]), reverse=True)
+    print(f"[LOOKUP] indexed {len(law_names)} law names")
+
+
+def resolve_law_name(question: str):
+    text = question.lower()
+    for alias, law_name in _law_aliases:
+        if re.search(rf"\b{re.escape(alias)}\b", text):
+            return law_name
+    return None
+
+
+# =========================
+# REFERENCE PARSING
+# =========================
+def _numbers(pattern, text: str) -> list[str]:
+    numbers = []
+    for match in pattern.finditer(text):
+        numbers.extend(n for n in re.findall(r"\d+", match.group(1)) if n not in numbers)
+    return numbers
+
+
+def parse_references(question: str) -> dict:
+    text = question.lower()
+    return {
+        "articles": _numbers(ARTICLE_REFS, text),
+        "sections": _numbers(SECTION_REFS, text),
+        "law_name": resolve_law_name(question)
+    }
+
+
+def article_lookup_filter(articles: list[str]) -> Filter:
+    return Filter(must=[
+        FieldCondition(key="metadata.article_number", match=MatchAny(any=articles))
+    ])
+
+
+def section_lookup_filter(sections: list[str], law_name: str = None) -> Filter:
+    must = [FieldCondition(key="metadata.section_number", match=MatchAny(any=sections))]
+    if law_name:
+        must.append(FieldCondition(key="metadata.law_name", match=MatchValue(value=law_name)))
+    return Filter(must=must)
@@ -1,16 +1,43 @@
 # to create a fastapi app to serve a langchain model
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import StreamingResponse
 # from Upload_into_database.upload_acts import ingest_act_pdfs
-from retrieve import legal_rag_answer
+from retrieve import alegal_rag_answer, aprepare_answer, afinish_answer, astream_groq, citations
 # from Upload_into_database.upload_constitution import ingest_constitution
 # from Upload_into_database.upload_old_case import ingest_case_docx
-from semantic_cache import get_semantic_cache, set_semantic_cache
+from semantic_cache import aget_semantic_cache, aset_semantic_cache, global_cache_stats
 from embedding import embeddings
+from clients import startup, ashutdown, get_clients
+from lookup import load_law_names
+from redis_client import async_redis_client
+from recommendation.storage import aclose_pool
+from recommendation.history_writer import history_writer, record_query
+import metrics
+from contextlib import asynccontextmanager
 import os
+import asyncio
+import json
 from typing import List
 import uuid
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build Qdrant/Groq clients and payload indexes once per worker
+    startup()
+    try:
+        load_law_names(get_clients().qdrant)
+    except Exception as e:
+        print(f"[LOOKUP] law name index unavailable: {e}")
+    yield
+    await ashutdown()
+    # Drain buffered query history before the DB pool goes away
+    await asyncio.to_thread(history_writer.close)
+    await aclose_pool()
+    await async_redis_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 DATASET_DIR = "dataset"
 
@@ -32,6 +59,14 @@ async def add_session_cookie(request: Request, call_next):
 def read_root(): 
     return {"message": "Welcome to FastAPI root endpoint!"}
 
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return global_cache_stats()
+
 # @app.post("/ingest_constitution/")
 # async def ingest_constitution_api(file: UploadFile = File(...)):
 #     if not file.filename.lower().endswith(".pdf"):
@@ -94,31 +129,118 @@ def read_root():
 async def query_model(question: str, user_id: str, user_role: str):
 
 
+    # Embed the question once for the cache and every vector search
+    query_vec = await embeddings.aembed_query(question)
+
     # 1️ Try semantic cache
-    cached_response = get_semantic_cache(
+    cached_response = await aget_semantic_cache(
         session_id=user_id,
         query=question,
-        embedder=embeddings
+        embedder=embeddings,
+        query_vec=query_vec
     )
 
     if cached_response:
-        # cached_response must already be a dict
+        # cached_response must already be a dict; citations are a streaming-only field
+        cached_response.pop("citations", None)
+        record_query(user_id, question, cached_response.get("query_type"), cached_response)
         return cached_response
 
     # 2 Call RAG pipeline
-    response = legal_rag_answer(
+    response = await alegal_rag_answer(
         question=question,
         user_id=user_id,
-        user_role=user_role
+        user_role=user_role,
+        query_vec=query_vec
     )
 
     #  Store full structured response in cache
-    set_semantic_cache(
+    await aset_semantic_cache(
         session_id=user_id,
         query=question,
         answer=response,  
-        embedder=embeddings
+        embedder=embeddings,
+        query_vec=query_vec
     )
 
     # Return response directly
-    return response
\ No newline at end of file
+    return response
+
+
+# =========================
+# STREAMING (SSE) ENDPOINT
+# =========================
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_answer(question: str, user_id: str, user_role: str):
+    query_vec = await embeddings.aembed_query(question)
+
+    # Cache hits are replayed in the same event format
+    cached_response = await aget_semantic_cache(
+        session_id=user_id,
+        query=question,
+        embedder=embeddings,
+        query_vec=query_vec
+    )
+    if cached_response:
+        record_query(user_id, question, cached_response.get("query_type"), cached_response)
+        yield sse_event("meta", {
+            "query_type": cached_response.get("query_type"),
+            "case_category": cached_response.get("case_category", ""),
+            "citations": cached_response.get("citations", []),
+            "cached": True
+        })
+        if cached_response.get("answer"):
+            yield sse_event("token", {"text": cached_response["answer"]})
+        yield sse_event("done", cached_response)
+        return
+
+    try:
+        prepared = await aprepare_answer(question, user_id, user_role, query_vec)
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+        return
+
+    response = prepared["response"]
+    response["citations"] = citations(prepared["docs"])
+    yield sse_event("meta", {
+        "query_type": response["query_type"],
+        "case_category": response["case_category"],
+        "citations": response["citations"],
+        "cached": False
+    })
+
+    if prepared["prompt"] is None:
+        if response["answer"]:
+            yield sse_event("token", {"text": response["answer"]})
+    else:
+        tokens = []
+        try:
+            async for token in astream_groq(prepared["prompt"]):
+                tokens.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        response = await afinish_answer(question, prepared, "".join(tokens))
+
+    # Cached with its citations so a streamed hit replays the same events
+    await aset_semantic_cache(
+        session_id=user_id,
+        query=question,
+        answer=response,
+        embedder=embeddings,
+        query_vec=query_vec
+    )
+    yield sse_event("done", response)
+
+
+@app.post("/query/stream")
+async def query_model_stream(question: str, user_id: str, user_role: str):
+    return StreamingResponse(
+        stream_answer(question, user_id, user_role),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
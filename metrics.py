@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+
+# In-process counters and summaries, served by GET /metrics.
+# Each uvicorn worker reports its own numbers.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_summaries = {}
+
+
+def incr(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    with _lock:
+        summary = _summaries.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        summary["count"] += 1
+        summary["total"] += value
+        summary["max"] = max(summary["max"], value)
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "summaries": {
+                name: {
+                    "count": s["count"],
+                    "mean": s["total"] / s["count"] if s["count"] else 0.0,
+                    "max": s["max"]
+                }
+                for name, s in _summaries.items()
+            }
+        }
@@ -1,12 +1,37 @@
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import re
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from clients import get_clients
+from local_classifier import LOCAL_CLASSIFIER_THRESHOLD, local_label, record_label
+from redis_client import redis_client, async_redis_client
+from semantic_cache import unit_vector
+import metrics
 
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
+ALLOWED_LABELS = {
+    "LOOKUP",
+    "INTERPRETATION",
+    "CASE_BASED",
+    "PREDICTIVE",
+    "GENERAL",
+    "NOT_LEGAL",
+    "RECOMMENDATION",
+}
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", 4096))
+CLASSIFICATION_CACHE_TTL = int(os.getenv("CLASSIFICATION_CACHE_TTL", 86400))
+# Reuse a label for near-identical questions above this cosine similarity; 0 disables
+CLASSIFICATION_SIM_THRESHOLD = float(os.getenv("CLASSIFICATION_SIM_THRESHOLD", 0))
+CLASSIFICATION_SIM_CANDIDATES = 512
+
+# Fraction of confident fast-path answers also sent to the LLM to
+# measure agreement; 0 disables shadow checks
+LOCAL_CLASSIFIER_SHADOW_RATE = float(os.getenv("LOCAL_CLASSIFIER_SHADOW_RATE", 0.0))
 
 QUERY_CLASSIFIER_PROMPT = """
 You are an expert legal query classifier for Nepali law.
@@ -42,18 +67,218 @@ Question:
 
 
 
+def _classifier_messages(question: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "You classify legal questions."},
+        {"role": "user", "content": QUERY_CLASSIFIER_PROMPT.format(question=question)}
+    ]
+
+
+def _parse_label(response) -> str:
+    print(f'response:{response}')
+
+    label = response.choices[0].message.content.strip().upper()
+    print(label)
+    return label
+
+
 def classify_query_llm(question: str) -> str:
-    response = client.chat.completions.create(
+    response = get_clients().groq.chat.completions.create(
         model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": "You classify legal questions."},
-            {"role": "user", "content": QUERY_CLASSIFIER_PROMPT.format(question=question)}
-        ],
+        messages=_classifier_messages(question),
         temperature=0.1,
         max_tokens=10
     )
-    print(f'response:{response}')
+    return _parse_label(response)
 
-    label = response.choices[0].message.content.strip().upper()
-    print(label)
-    return label
+
+async def aclassify_query_llm(question: str) -> str:
+    response = await get_clients().agroq.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=_classifier_messages(question),
+        temperature=0.1,
+        max_tokens=10
+    )
+    return _parse_label(response)
+
+
+# =========================
+# CLASSIFICATION CACHE
+# =========================
+def normalize_question(question: str) -> str:
+    text = re.sub(r"\s+", " ", question.lower()).strip()
+    return text.rstrip("?.! ")
+
+
+class ClassificationCache:
+    """Bounded in-process TTL cache of LLM labels, optionally matched by embedding."""
+
+    def __init__(self, max_size: int = CLASSIFICATION_CACHE_SIZE, ttl: int = CLASSIFICATION_CACHE_TTL):
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, key: str, query_vec=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+            if CLASSIFICATION_SIM_THRESHOLD <= 0 or query_vec is None:
+                return None
+
+            # Most recent entries that carry an embedding
+            recent = [
+                e for e in reversed(self._entries.values())
+                if e[2] is not None and e[1] > now
+            ][:CLASSIFICATION_SIM_CANDIDATES]
+
+        query_vec = unit_vector(query_vec)
+        recent = [e for e in recent if e[2].shape == query_vec.shape]
+        if not recent:
+            return None
+
+        scores = np.stack([e[2] for e in recent]) @ query_vec
+        best = int(np.argmax(scores))
+        return recent[best][0] if scores[best] >= CLASSIFICATION_SIM_THRESHOLD else None
+
+    def put(self, key: str, label: str, query_vec=None):
+        vec = unit_vector(query_vec) if query_vec is not None else None
+        with self._lock:
+            self._entries[key] = (label, time.time() + self._ttl, vec)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+_label_cache = ClassificationCache()
+
+
+def _redis_key(key: str) -> str:
+    return f"cls:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+
+def _valid_label(label: str) -> bool:
+    # Never cache or learn from garbage model output
+    if label in ALLOWED_LABELS:
+        return True
+    metrics.incr("classifier.invalid_label")
+    print(f"[CLASSIFIER] unexpected label not cached: {label!r}")
+    return False
+
+
+def _cached_label(key: str, query_vec=None):
+    label = _label_cache.get(key, query_vec)
+    if label:
+        metrics.incr("classifier.cache.memory")
+        return label
+
+    label = redis_client.get(_redis_key(key))
+    if label in ALLOWED_LABELS:
+        metrics.incr("classifier.cache.redis")
+        _label_cache.put(key, label, query_vec)
+        return label
+    return None
+
+
+def _remember_label(question: str, key: str, label: str, query_vec=None):
+    if _valid_label(label):
+        _label_cache.put(key, label, query_vec)
+        redis_client.setex(_redis_key(key), CLASSIFICATION_CACHE_TTL, label)
+        record_label(question, label)
+
+
+async def _acached_label(key: str, query_vec=None):
+    label = _label_cache.get(key, query_vec)
+    if label:
+        metrics.incr("classifier.cache.memory")
+        return label
+
+    label = await async_redis_client.get(_redis_key(key))
+    if label in ALLOWED_LABELS:
+        metrics.incr("classifier.cache.redis")
+        _label_cache.put(key, label, query_vec)
+        return label
+    return None
+
+
+async def _aremember_label(question: str, key: str, label: str, query_vec=None):
+    if _valid_label(label):
+        _label_cache.put(key, label, query_vec)
+        await async_redis_client.setex(_redis_key(key), CLASSIFICATION_CACHE_TTL, label)
+        # Blocking file append, keep it off the event loop
+        await asyncio.to_thread(record_label, question, label)
+
+
+# =========================
+# LOCAL FAST PATH + LLM FALLBACK
+# =========================
+def _record_agreement(local: str, llm: str):
+    metrics.incr("classifier.agreement.match" if local == llm else "classifier.agreement.mismatch")
+
+
+def _fast_path(question: str):
+    label, confidence, source = local_label(question)
+    if label and confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+        metrics.incr(f"classifier.fastpath.{source}")
+        return label, None
+    return None, label
+
+
+def classify_query(question: str, query_vec=None) -> str:
+    """Local rules/model first, then cached LLM labels, then the Groq classifier."""
+    label, low_confidence_label = _fast_path(question)
+
+    if label:
+        if random.random() < LOCAL_CLASSIFIER_SHADOW_RATE:
+            _record_agreement(label, classify_query_llm(question))
+        return label
+
+    key = normalize_question(question)
+    cached = _cached_label(key, query_vec)
+    if cached:
+        return cached
+
+    metrics.incr("classifier.llm")
+    llm_label = classify_query_llm(question)
+    _remember_label(question, key, llm_label, query_vec)
+    if low_confidence_label:
+        _record_agreement(low_confidence_label, llm_label)
+    return llm_label
+
+
+# The loop only holds weak references to tasks; keep shadow checks alive until done
+_shadow_tasks = set()
+
+
+async def _ashadow_check(question: str, label: str):
+    try:
+        _record_agreement(label, await aclassify_query_llm(question))
+    except Exception as e:
+        print(f"[CLASSIFIER] shadow check failed: {e}")
+
+
+async def aclassify_query(question: str, query_vec=None) -> str:
+    label, low_confidence_label = _fast_path(question)
+
+    if label:
+        if random.random() < LOCAL_CLASSIFIER_SHADOW_RATE:
+            task = asyncio.create_task(_ashadow_check(question, label))
+            _shadow_tasks.add(task)
+            task.add_done_callback(_shadow_tasks.discard)
+        return label
+
+    key = normalize_question(question)
+    cached = await _acached_label(key, query_vec)
+    if cached:
+        return cached
+
+    metrics.incr("classifier.llm")
+    llm_label = await aclassify_query_llm(question)
+    await _aremember_label(question, key, llm_label, query_vec)
+    if low_confidence_label:
+        _record_agreement(low_confidence_label, llm_label)
+    return llm_label
@@ -0,0 +1,205 @@
+import os
+from dotenv import load_dotenv
+from redis.exceptions import RedisError, WatchError
+import metrics
+from redis_client import redis_client, async_redis_client
+from recommendation.storage import fetch_user_queries, afetch_user_queries, HISTORY_WINDOW
+
+load_dotenv()
+
+HISTORY_WINDOW_TTL = int(os.getenv("HISTORY_WINDOW_TTL", 7 * 86400))
+# Users with no history are cached as empty for this long
+HISTORY_EMPTY_TTL = int(os.getenv("HISTORY_EMPTY_TTL", 300))
+# Lifetime of a window claimed by a reader that has not finished loading it
+HISTORY_LOADING_TTL = int(os.getenv("HISTORY_LOADING_TTL", 30))
+
+# Sole element of the window of a user with no history yet
+EMPTY_WINDOW = "\x00empty"
+# Tail element of a window a reader is loading from Postgres
+LOADING_WINDOW = "\x00loading"
+
+
+# =========================
+# PER-USER ROLLING WINDOW
+# =========================
+# hist:{user_id} is a Redis list of the user's last HISTORY_WINDOW queries,
+# newest first. The history writer pushes onto it once records are
+# committed; a missing list is rebuilt from Postgres on the next read.
+#
+# A reader that misses first claims the key with a LOADING_WINDOW marker,
+# so queries committed while it reads Postgres still land on the list, and
+# merges them with the rows it read. Windows live HISTORY_WINDOW_TTL from
+# when they were loaded; pushes do not extend them.
+#
+# Rows deleted from ai_assistant_aiqueryhistory outside this service (the
+# Django app owns the table) stay in the window until HISTORY_WINDOW_TTL
+# expires, unless the deleting code calls invalidate_user_window.
+def window_key(user_id: str) -> str:
+    return f"hist:{user_id}"
+
+
+def invalidate_user_window(user_id: str):
+    """Drops a user's window so the next read rebuilds it from Postgres."""
+    redis_client.delete(window_key(user_id))
+
+
+def push_to_windows(records: list):
+    """Called by the history writer with committed (user_id, query, query_type, response) records, oldest first."""
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id, query, _, _ in records:
+        key = window_key(user_id)
+        # LPUSHX: a list that was never loaded must not start out with only the newest query
+        pipe.lpushx(key, query)
+        pipe.lrem(key, 0, EMPTY_WINDOW)
+        pipe.ltrim(key, 0, HISTORY_WINDOW)
+    pipe.execute()
+
+
+def _window_queries(window: list, limit: int):
+    """Queries in a loaded window, or None while it is still being loaded."""
+    if LOADING_WINDOW in window:
+        return None
+    return [q for q in window if q != EMPTY_WINDOW][:limit]
+
+
+def _merged_window(window: list, queries: list):
+    """
+    Rows read from Postgres plus whatever was pushed onto the claimed window
+    meanwhile (the entries ahead of the marker). Pushes committed before the
+    read are also the newest rows read, so that overlap is dropped once.
+    None if the claim was lost.
+    """
+    if LOADING_WINDOW not in window:
+        return None
+    pushed = window[:window.index(LOADING_WINDOW)]
+    overlap = next(
+        (k for k in range(min(len(pushed), len(queries)), 0, -1) if pushed[-k:] == queries[:k]),
+        0
+    )
+    return (pushed + queries[overlap:])[:HISTORY_WINDOW]
+
+
+def _claim_commands(pipe, key: str):
+    pipe.rpush(key, LOADING_WINDOW)
+    pipe.expire(key, HISTORY_LOADING_TTL)
+
+
+def _fill_commands(pipe, key: str, queries: list):
+    pipe.delete(key)
+    if queries:
+        pipe.rpush(key, *queries)
+        pipe.expire(key, HISTORY_WINDOW_TTL)
+    else:
+        # Cached as empty so users without history do not hit Postgres on every read
+        pipe.rpush(key, EMPTY_WINDOW)
+        pipe.expire(key, HISTORY_EMPTY_TTL)
+
+
+def _claim(key: str) -> bool:
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            if pipe.exists(key):
+                return False
+            pipe.multi()
+            _claim_commands(pipe, key)
+            pipe.execute()
+            return True
+        except WatchError:
+            return False
+
+
+def _backfill(key: str, queries: list):
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            merged = _merged_window(pipe.lrange(key, 0, -1), queries)
+            if merged is None:
+                return
+            pipe.multi()
+            _fill_commands(pipe, key, merged)
+            pipe.execute()
+        except WatchError:
+            pass
+
+
+def recent_user_queries(user_id: str, limit: int = HISTORY_WINDOW) -> list[str]:
+    """The user's last `limit` queries, newest first, from Redis when the window is loaded."""
+    key = window_key(user_id)
+    try:
+        window = redis_client.lrange(key, 0, -1)
+        queries = _window_queries(window, limit) if window else None
+        if queries is not None:
+            metrics.incr("history.window.hits")
+            return queries
+        claimed = not window and _claim(key)
+    except RedisError as e:
+        print(f"[HISTORY] window read failed: {e}")
+        return fetch_user_queries(user_id, limit)
+
+    metrics.incr("history.window.misses")
+    queries = fetch_user_queries(user_id, HISTORY_WINDOW)
+    if not claimed:
+        # Another reader is loading the window
+        return queries[:limit]
+    try:
+        _backfill(key, queries)
+    except RedisError as e:
+        print(f"[HISTORY] window backfill failed: {e}")
+    return queries[:limit]
+
+
+# =========================
+# ASYNC
+# =========================
+async def _aclaim(key: str) -> bool:
+    async with async_redis_client.pipeline() as pipe:
+        try:
+            await pipe.watch(key)
+            if await pipe.exists(key):
+                return False
+            pipe.multi()
+            _claim_commands(pipe, key)
+            await pipe.execute()
+            return True
+        except WatchError:
+            return False
+
+
+async def _abackfill(key: str, queries: list):
+    async with async_redis_client.pipeline() as pipe:
+        try:
+            await pipe.watch(key)
+            merged = _merged_window(await pipe.lrange(key, 0, -1), queries)
+            if merged is None:
+                return
+            pipe.multi()
+            _fill_commands(pipe, key, merged)
+            await pipe.execute()
+        except WatchError:
+            pass
+
+
+async def arecent_user_queries(user_id: str, limit: int = HISTORY_WINDOW) -> list[str]:
+    key = window_key(user_id)
+    try:
+        window = await async_redis_client.lrange(key, 0, -1)
+        queries = _window_queries(window, limit) if window else None
+        if queries is not None:
+            metrics.incr("history.window.hits")
+            return queries
+        claimed = not window and await _aclaim(key)
+    except RedisError as e:
+        print(f"[HISTORY] window read failed: {e}")
+        return await afetch_user_queries(user_id, limit)
+
+    metrics.incr("history.window.misses")
+    queries = await afetch_user_queries(user_id, HISTORY_WINDOW)
+    if not claimed:
+        # Another reader is loading the window
+        return queries[:limit]
+    try:
+        await _abackfill(key, queries)
+    except RedisError as e:
+        print(f"[HISTORY] window backfill failed: {e}")
+    return queries[:limit]
@@ -0,0 +1,134 @@
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from dotenv import load_dotenv
+import metrics
+from recommendation.storage import store_user_queries
+from recommendation.history_cache import push_to_windows
+
+load_dotenv()
+
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 100))
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", 1.0))
+# Records held while Postgres is unreachable; the oldest are dropped beyond this
+HISTORY_BUFFER_MAX = int(os.getenv("HISTORY_BUFFER_MAX", 10000))
+HISTORY_RETRY_MAX_SECONDS = float(os.getenv("HISTORY_RETRY_MAX_SECONDS", 30))
+HISTORY_DRAIN_TIMEOUT = float(os.getenv("HISTORY_DRAIN_TIMEOUT", 10))
+
+# Query types kept out of the history, whether the answer was generated or cached
+UNRECORDED_QUERY_TYPES = {"NOT_LEGAL"}
+
+
+# =========================
+# WRITE-BEHIND QUEUE
+# =========================
+class HistoryWriter:
+    """
+    Buffers query-history records in memory and inserts them from a
+    background thread, HISTORY_BATCH_SIZE at a time or every
+    HISTORY_FLUSH_SECONDS, so the request path never waits on Postgres.
+    """
+
+    def __init__(self, batch_size: int = HISTORY_BATCH_SIZE,
+                 flush_seconds: float = HISTORY_FLUSH_SECONDS,
+                 buffer_max: int = HISTORY_BUFFER_MAX):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.buffer_max = buffer_max
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _ensure_thread(self):
+        # Started on first use, so forked workers each get their own
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id: str, query: str, query_type: str, response: dict):
+        """Queues one record; never blocks on the database."""
+        with self._cond:
+            if len(self._buffer) >= self.buffer_max:
+                self._buffer.popleft()
+                metrics.incr("history.dropped")
+            self._buffer.append((user_id, query, query_type, dict(response)))
+            self._ensure_thread()
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def _take_batch(self):
+        with self._cond:
+            if not self._stopping and len(self._buffer) < self.batch_size:
+                self._cond.wait(self.flush_seconds)
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _requeue(self, batch: list):
+        # Failed records go back in front, but never push the buffer past its bound
+        with self._cond:
+            room = self.buffer_max - len(self._buffer)
+            if room < len(batch):
+                metrics.incr("history.dropped", len(batch) - max(room, 0))
+                batch = batch[len(batch) - max(room, 0):]
+            self._buffer.extendleft(reversed(batch))
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                continue
+
+            try:
+                started = time.perf_counter()
+                store_user_queries(batch)
+                metrics.observe("history.flush_ms", (time.perf_counter() - started) * 1000)
+                metrics.incr("history.written", len(batch))
+                backoff = 0.0
+            except Exception as e:
+                metrics.incr("history.flush_errors")
+                self._requeue(batch)
+                if self._stopping:
+                    print(f"[HISTORY] dropping {len(self._buffer)} records on shutdown: {e}")
+                    return
+                backoff = min(max(backoff * 2, 1.0), HISTORY_RETRY_MAX_SECONDS)
+                print(f"[HISTORY] flush failed, retrying in {backoff:.0f}s: {e}")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopping, backoff)
+                continue
+
+            # Only after the commit: a window rebuilt from Postgres in between
+            # would otherwise never see these records
+            try:
+                push_to_windows(batch)
+            except Exception as e:
+                print(f"[HISTORY] window update failed: {e}")
+
+    def close(self, timeout: float = HISTORY_DRAIN_TIMEOUT):
+        """Flushes what is buffered (up to timeout) and stops the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                print(f"[HISTORY] drain timed out with {len(self._buffer)} records left")
+
+
+history_writer = HistoryWriter()
+atexit.register(history_writer.close)
+
+
+def record_query(user_id: str, query: str, query_type: str, response: dict):
+    if query_type in UNRECORDED_QUERY_TYPES:
+        return
+    history_writer.submit(user_id, query, query_type, response)
@@ -0,0 +1,4 @@
+-- Backs the per-user recent-window and keyset pagination queries in
+-- recommendation/storage.py: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ai_assistant_aiqueryhistory_user_created_idx
+    ON ai_assistant_aiqueryhistory (user_id, created_at DESC, id DESC);
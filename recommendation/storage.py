@@ -1,56 +1,312 @@
 import os
-import uuid
+import sys
+import glob
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.extras import RealDictCursor, Json, execute_values
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 
 # Read the full connection string from .env
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# psycopg2 keeps at most DB_POOL_MIN idle connections; extra ones close on return
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 4))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+# How long a caller may wait for a free connection before PoolError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Connections idle longer than this are pinged before being handed out
+DB_HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_HEALTHCHECK_IDLE_SECONDS", 30))
+# Most recent queries a recommendation looks at
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", 20))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Session-level PREPARE does not survive transaction-pooling proxies such as PgBouncer
+DB_PREPARE_STATEMENTS = os.getenv("DB_PREPARE_STATEMENTS", "true").lower() == "true"
+
+# Hot statements, prepared once per pooled connection
+PREPARED_STATEMENTS = {
+    "insert_query_history": """
+        INSERT INTO ai_assistant_aiqueryhistory
+        (user_id, query, query_type, response)
+        VALUES ($1, $2, $3, $4)
+    """,
+    # Both served by the (user_id, created_at, id) index from migrations/
+    "fetch_user_queries": """
+        SELECT id, query, created_at
+        FROM ai_assistant_aiqueryhistory
+        WHERE user_id = $1
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+    """,
+    "fetch_user_queries_before": """
+        SELECT id, query, created_at
+        FROM ai_assistant_aiqueryhistory
+        WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $4
+    """,
+}
+
+
 def get_db_connection():
     return psycopg2.connect(
         DATABASE_URL,
         cursor_factory=RealDictCursor
     )
 
+
+# =========================
+# CONNECTION POOL
+# =========================
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether its statements are prepared and when it was last used."""
+    prepared = False
+    returned_at = 0.0
+
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool that waits (up to DB_POOL_TIMEOUT) instead of
+    failing when every connection is busy, pings connections that sat idle,
+    and prepares the hot statements on each new connection.
+    """
+
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX):
+        self._pool = ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            DATABASE_URL,
+            connection_factory=PooledConnection,
+            cursor_factory=RealDictCursor
+        )
+        # getconn raises as soon as the pool is exhausted; the semaphore turns that into a wait
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.returned_at < DB_HEALTHCHECK_IDLE_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _prepare(self, conn):
+        if DB_PREPARE_STATEMENTS:
+            with conn.cursor() as cur:
+                for name, sql in PREPARED_STATEMENTS.items():
+                    cur.execute(f"PREPARE {name} AS {sql}")
+            conn.commit()
+        conn.prepared = True
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            metrics.incr("db.pool.timeouts")
+            raise PoolError(f"no database connection free after {DB_POOL_TIMEOUT}s")
+
+        try:
+            conn = self._pool.getconn()
+            if conn.prepared and not self._healthy(conn):
+                metrics.incr("db.pool.reconnects")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+
+            if not conn.prepared:
+                self._prepare(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        metrics.observe("db.pool.wait_ms", (time.perf_counter() - started) * 1000)
+        return conn
+
+    def putconn(self, conn, broken: bool = False):
+        try:
+            conn.returned_at = time.monotonic()
+            self._pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Created on first use, so each forked worker builds its own."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+# =========================
+# QUERIES
+# =========================
 def store_user_query(
     user_id: str,
     query: str,
     query_type: str,
-    response: str 
+    response: str
 ):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        params = (user_id, query, query_type, Json(response))
+        if DB_PREPARE_STATEMENTS:
+            cur.execute("EXECUTE insert_query_history (%s, %s, %s, %s)", params)
+        else:
+            cur.execute(
+                """
+                INSERT INTO ai_assistant_aiqueryhistory
+                (user_id, query, query_type,response)
+                VALUES (%s, %s, %s, %s)
+                """,
+                params
+            )
+
+
+def store_user_queries(records: list):
+    """Inserts (user_id, query, query_type, response) records in one statement."""
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO ai_assistant_aiqueryhistory
+            (user_id, query, query_type, response)
+            VALUES %s
+            """,
+            [(user_id, query, query_type, Json(response)) for user_id, query, query_type, response in records],
+            page_size=max(len(records), 1)
+        )
+
+
+def fetch_user_query_page(user_id: str, limit: int = HISTORY_WINDOW, before: tuple = None):
+    """
+    One page of a user's queries, newest first. before is the cursor
+    returned by the previous page; the returned cursor is None on the last page.
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        if before is None:
+            if DB_PREPARE_STATEMENTS:
+                cur.execute("EXECUTE fetch_user_queries (%s, %s)", (user_id, limit))
+            else:
+                cur.execute("""
+                    SELECT id, query, created_at
+                    FROM ai_assistant_aiqueryhistory
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (user_id, limit))
+        else:
+            created_at, row_id = before
+            if DB_PREPARE_STATEMENTS:
+                cur.execute(
+                    "EXECUTE fetch_user_queries_before (%s, %s, %s, %s)",
+                    (user_id, created_at, row_id, limit)
+                )
+            else:
+                cur.execute("""
+                    SELECT id, query, created_at
+                    FROM ai_assistant_aiqueryhistory
+                    WHERE user_id = %s AND (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (user_id, created_at, row_id, limit))
+
+        rows = cur.fetchall()
+
+    cursor = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return [r["query"] for r in rows], cursor
 
-    cur.execute(
-        """
-        INSERT INTO ai_assistant_aiqueryhistory
-        (user_id, query, query_type,response)
-        VALUES (%s, %s, %s, %s)
-        """,
-        (user_id, query, query_type, Json(response))
-    )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def fetch_user_queries(user_id: str, limit: int = HISTORY_WINDOW):
+    """The user's most recent queries, newest first."""
+    return fetch_user_query_page(user_id, limit)[0]
 
-def fetch_user_queries(user_id: str):
+
+def apply_migrations(migrations_dir: str = MIGRATIONS_DIR):
+    # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction
     conn = get_db_connection()
-    cur = conn.cursor()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for path in sorted(glob.glob(os.path.join(migrations_dir, "*.sql"))):
+                with open(path, encoding="utf-8") as f:
+                    cur.execute(f.read())
+                print(f"✅ Applied {os.path.basename(path)}")
+    finally:
+        conn.close()
+
+
+# psycopg2 is blocking, so the async path runs it on worker threads. They
+# are a dedicated pool sized to the connection pool: a caller waiting for a
+# connection must not hold a default-executor thread that embedding and
+# other to_thread work also need.
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+
+
+async def _run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, fn, *args)
+
+
+async def astore_user_query(user_id: str, query: str, query_type: str, response: str):
+    await _run_db(store_user_query, user_id, query, query_type, response)
+
+
+async def afetch_user_queries(user_id: str, limit: int = HISTORY_WINDOW):
+    return await _run_db(fetch_user_queries, user_id, limit)
+
+
+async def afetch_user_query_page(user_id: str, limit: int = HISTORY_WINDOW, before: tuple = None):
+    return await _run_db(fetch_user_query_page, user_id, limit, before)
 
-    cur.execute("""
-        SELECT query
-        FROM ai_assistant_aiqueryhistory
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-    """, (user_id,))
 
-    rows = cur.fetchall()
+async def aclose_pool():
+    await _run_db(close_pool)
 
-    cur.close()
-    conn.close()
 
-    return [r["query"] for r in rows]
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        apply_migrations()
+    else:
+        print("usage: python -m recommendation.storage migrate")
@@ -1,10 +1,4 @@
-from openai import OpenAI
-import os
-
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
+from clients import get_clients
 
 LAWYER_RECOMMENDATION_PROMPT = """
 You are a classification engine.
@@ -32,19 +26,45 @@ User's past questions:
 
 
 
-def recommend_lawyer_from_history(current_query:str,user_queries: list[str]) -> str:
+def _category_from_query(current_query: str):
     query_lower = current_query.lower().strip()
     for category in ["criminal", "civil", "finance", "corporate"]:
          if category in query_lower:
              return category.capitalize()
+    return None
+
+
+def _recommendation_messages(user_queries: list[str]) -> list[dict]:
     joined_queries = "\n".join(f"- {q}" for q in user_queries)
+    return [
+        {"role": "system", "content": "You recommend lawyer categories based on user history."},
+        {"role": "user", "content": LAWYER_RECOMMENDATION_PROMPT.format(queries=joined_queries)}
+    ]
+
+
+def recommend_lawyer_from_history(current_query:str,user_queries: list[str]) -> str:
+    category = _category_from_query(current_query)
+    if category:
+        return category
+
+    response = get_clients().groq.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=_recommendation_messages(user_queries),
+        temperature=0.2,
+        max_tokens=50
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+async def arecommend_lawyer_from_history(current_query: str, user_queries: list[str]) -> str:
+    category = _category_from_query(current_query)
+    if category:
+        return category
 
-    response = client.chat.completions.create(
+    response = await get_clients().agroq.chat.completions.create(
         model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": "You recommend lawyer categories based on user history."},
-            {"role": "user", "content": LAWYER_RECOMMENDATION_PROMPT.format(queries=joined_queries)}
-        ],
+        messages=_recommendation_messages(user_queries),
         temperature=0.2,
         max_tokens=50
     )
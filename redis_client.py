@@ -1,5 +1,6 @@
 import os
 import redis
+import redis.asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,3 +9,6 @@ REDIS_URL = os.getenv("REDIS_URL")
 REDIS_TTL = int(os.getenv("REDIS_TTL", 1800))
 
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# Used by the async request path
+async_redis_client = redis.asyncio.from_url(REDIS_URL, decode_responses=True)
@@ -1,16 +1,29 @@
 import os
-import re
+import time
 import uuid
-from dotenv import load_dotenv
-from openai import OpenAI
-from qdrant_client.http.models import PayloadSchemaType
-from qdrant_client import QdrantClient
-from langchain_qdrant import QdrantVectorStore
-from query_classifier import classify_query_llm
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langchain_core.documents import Document
+from clients import get_clients, CONSTITUTION_COLLECTION, ACTS_COLLECTION, CASES_COLLECTION
+from query_classifier import classify_query, aclassify_query
+from local_classifier import ARTICLE_PATTERN, SECTION_PATTERN
+from constitution_index import constitution_index
+from lookup import parse_references, article_lookup_filter, section_lookup_filter
+from Upload_into_database.collection_config import search_params
+from qdrant_client.models import Filter, FieldCondition, MatchValue, QueryRequest
 from embedding import embeddings
-from recommendation.storage import store_user_query, fetch_user_queries
-from recommendation.user_recommendation import recommend_lawyer_from_history
+import metrics
+from semantic_cache import (
+    GLOBAL_CACHE_ENABLED,
+    get_global_cache,
+    set_global_cache,
+    aget_global_cache,
+    aset_global_cache
+)
+from recommendation.history_cache import recent_user_queries, arecent_user_queries
+from recommendation.history_writer import record_query
+from recommendation.user_recommendation import recommend_lawyer_from_history, arecommend_lawyer_from_history
 
 from prompts.prompt import (
     LOOKUP_PROMPT,
@@ -21,56 +34,16 @@ from prompts.prompt import (
 
 
 SIMILARITY_THRESHOLD = 0.8
+# Rescoring/oversampling for quantized collections (None when not configured)
+SEARCH_PARAMS = search_params()
 
 
 # =========================
 # INITIALIZATION FUNCTION
 # =========================
 def init_clients():
-    load_dotenv()
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    QDRANT_URL = os.getenv("QDRANT_URL")
-    QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-
-    qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-   
-
-    try:
-        qdrant.create_payload_index(
-            collection_name="nepal_constitution",
-            field_name="metadata.article_number",
-            field_schema=PayloadSchemaType.KEYWORD
-        )
-    except Exception:
-        pass 
-
-    qdrant.create_payload_index(
-    collection_name="nepal_acts",
-    field_name="metadata.section_number",
-    field_schema=PayloadSchemaType.KEYWORD
-)
-    constitution_store = QdrantVectorStore(
-        client=qdrant,
-        collection_name="nepal_constitution",
-        embedding=embeddings
-    )
-    case_store = QdrantVectorStore(
-        client=qdrant,
-        collection_name="case_laws",
-        embedding=embeddings
-    )
-    act_store = QdrantVectorStore(
-        client=qdrant,
-        collection_name="nepal_acts",
-        embedding=embeddings
-    )
-
-    groq_client = OpenAI(
-        api_key=GROQ_API_KEY,
-        base_url="https://api.groq.com/openai/v1",
-    )
-
-    return constitution_store, case_store, act_store, groq_client
+    clients = get_clients()
+    return clients.constitution_store, clients.case_store, clients.act_store, clients.groq
 
 
 def filter_by_similarity(results, threshold, label="DOC"):
@@ -91,54 +64,110 @@ def filter_by_similarity(results, threshold, label="DOC"):
 # =========================
 # SEARCH HELPERS
 # =========================
-def hybrid_constitution_search(store, query: str, k: int = 3):
-    article_no = re.search(r"\barticle\s+(\d+)", query.lower()) 
-    if article_no: 
-        docs = store.similarity_search( 
-            query, 
-            k=k, 
-            filter=Filter( 
-                must=[FieldCondition( 
-                    key="metadata.article_number", 
-                    match=MatchValue(value=article_no.group(1)) 
-                    )] 
-                    ) 
-                    ) 
-        if docs: 
-            return docs 
-    return store.similarity_search(query, k=k)
-
-
-
-
-def retrieve_act_semantic(store, query: str, k: int = 5):
+def query_vector(query: str, query_vec=None) -> list:
+    # Reuse the request's embedding when the caller already has one
+    if query_vec is None:
+        query_vec = embeddings.embed_query(query)
+    return np.asarray(query_vec, dtype=float).tolist()
+
+
+def point_to_document(point, collection_name: str) -> Document:
+    # Same shape QdrantVectorStore builds from its page_content/metadata payload
+    metadata = point.payload.get("metadata") or {}
+    metadata["_id"] = point.id
+    metadata["_collection_name"] = collection_name
+    return Document(page_content=point.payload.get("page_content", ""), metadata=metadata)
+
+
+def article_filter(query: str):
+    article_no = ARTICLE_PATTERN.search(query.lower())
+    if not article_no:
+        return None
+    return Filter( 
+        must=[FieldCondition( 
+            key="metadata.article_number", 
+            match=MatchValue(value=article_no.group(1)) 
+            )] 
+            ) 
+
+
+def section_filter(query: str):
     # Look for "section <number>" in the query
-    section_no = re.search(r"\bsection\s+(\d+)", query.lower())
-
-    if section_no:
-        docs = store.similarity_search(
-            query,
-            k=k,
-            filter=Filter(
-                must=[
-                    FieldCondition(
-                        key="metadata.section_number",
-                        match=MatchValue(value=section_no.group(1))
-                    )
-                ]
+    section_no = SECTION_PATTERN.search(query.lower())
+    if not section_no:
+        return None
+    return Filter(
+        must=[
+            FieldCondition(
+                key="metadata.section_number",
+                match=MatchValue(value=section_no.group(1))
             )
-        )
-        if docs:
-            return docs
+        ]
+    )
+
+
+def local_constitution_search(query: str, k: int, query_vec: list):
+    """Exact in-process search when a constitution export is loaded, else None."""
+    if constitution_index is None:
+        return None
+
+    article_no = ARTICLE_PATTERN.search(query.lower())
+    return constitution_index.search(query_vec, k, article_no.group(1) if article_no else None)
+
+
+def fallback_search_requests(query_vec: list, k: int, query_filter=None) -> list:
+    """
+    Filtered and unfiltered searches sent together with query_batch_points,
+    so the fallback costs no extra round trip or embedding.
+    """
+    requests = []
+    if query_filter:
+        requests.append(QueryRequest(
+            query=query_vec, filter=query_filter, limit=k, with_payload=True, params=SEARCH_PARAMS
+        ))
+    requests.append(QueryRequest(query=query_vec, limit=k, with_payload=True, params=SEARCH_PARAMS))
+    return requests
+
+
+def first_hits(responses, collection_name: str) -> list:
+    # Filtered hits win; the unfiltered branch is only used when they are empty
+    for response in responses:
+        if response.points:
+            return [point_to_document(p, collection_name) for p in response.points]
+    return []
+
 
-    # Fallback: no section number found, just do a plain similarity search
-    return store.similarity_search(query, k=k)
+def hybrid_constitution_search(store, query: str, k: int = 3, query_vec=None):
+    query_vec = query_vector(query, query_vec)
+    docs = local_constitution_search(query, k, query_vec)
+    if docs is not None:
+        return docs
 
+    responses = store.client.query_batch_points(
+        collection_name=store.collection_name,
+        requests=fallback_search_requests(query_vec, k, article_filter(query))
+    )
+    return first_hits(responses, store.collection_name)
+
+
+
+
+def retrieve_act_semantic(store, query: str, k: int = 5, query_vec=None):
+    query_vec = query_vector(query, query_vec)
+
+    # Section-filtered search, falling back to a plain similarity search
+    responses = store.client.query_batch_points(
+        collection_name=store.collection_name,
+        requests=fallback_search_requests(query_vec, k, section_filter(query))
+    )
+    return first_hits(responses, store.collection_name)
 
 
 
-def hybrid_case_search(store, query: str, k: int = 5):
-    results = store.similarity_search_with_score(query, k=k)
+
+def hybrid_case_search(store, query: str, k: int = 5, query_vec=None):
+    query_vec = query_vector(query, query_vec)
+    results = store.similarity_search_with_score_by_vector(query_vec, k=k, search_params=SEARCH_PARAMS)
 
     # ONLY semantic filtering — no keyword hacks
     docs = filter_by_similarity(
@@ -150,32 +179,185 @@ def hybrid_case_search(store, query: str, k: int = 5):
     return docs
 
 
+# =========================
+# DIRECT LOOKUP
+# =========================
+# LOOKUP questions that name an article/section are answered by payload
+# filter alone (scroll), with no embedding or ANN search. Each reference is
+# scrolled on its own, page by page, so every chunk of it is returned.
+LOOKUP_PAGE_SIZE = int(os.getenv("LOOKUP_PAGE_SIZE", 16))
+# Upper bound on points read for one referenced article/section
+LOOKUP_MAX_POINTS = int(os.getenv("LOOKUP_MAX_POINTS", 64))
+
+
+def _lookup_requests(question: str) -> list[tuple]:
+    """(collection, filter, law_name) per referenced article/section, in question order."""
+    refs = parse_references(question)
+    requests = []
+
+    for article in refs["articles"]:
+        requests.append((CONSTITUTION_COLLECTION, article_lookup_filter([article]), None))
+    for section in refs["sections"]:
+        requests.append((ACTS_COLLECTION, section_lookup_filter([section], refs["law_name"]), refs["law_name"]))
+
+    return requests
+
+
+def _ambiguous(collection_name: str, law_name, law_names: set) -> bool:
+    # A bare "section 12" matches that section in every Act, leave it to vector search
+    return collection_name == ACTS_COLLECTION and law_name is None and len(law_names) > 1
+
+
+def _chunk_order(doc: Document):
+    # Scroll returns points in (random) ID order; put a reference's chunks back in document order
+    meta = doc.metadata
+    chapter = str(meta.get("chapter_number") or "")
+    return (meta.get("law_name") or "", int(chapter) if chapter.isdigit() else 0, chapter, meta.get("chunk_index") or 0)
+
+
+def _scroll_kwargs(collection_name: str, query_filter, offset, read: int) -> dict:
+    return dict(
+        collection_name=collection_name,
+        scroll_filter=query_filter,
+        limit=min(LOOKUP_PAGE_SIZE, LOOKUP_MAX_POINTS - read),
+        offset=offset,
+        with_payload=True,
+        with_vectors=False
+    )
+
+
+def _collect_page(collection_name: str, law_name, points, docs: list, law_names: set) -> bool:
+    """Adds a scrolled page; False once the reference is known to be ambiguous."""
+    for p in points:
+        doc = point_to_document(p, collection_name)
+        law_names.add(doc.metadata.get("law_name"))
+        docs.append(doc)
+    return not _ambiguous(collection_name, law_name, law_names)
+
+
+def _lookup_reference(collection_name: str, query_filter, law_name) -> list:
+    docs, law_names, offset = [], set(), None
+    while len(docs) < LOOKUP_MAX_POINTS:
+        points, offset = get_clients().qdrant.scroll(**_scroll_kwargs(collection_name, query_filter, offset, len(docs)))
+        if not _collect_page(collection_name, law_name, points, docs, law_names):
+            return []
+        if offset is None:
+            break
+    return sorted(docs, key=_chunk_order)
+
+
+async def _alookup_reference(collection_name: str, query_filter, law_name) -> list:
+    docs, law_names, offset = [], set(), None
+    while len(docs) < LOOKUP_MAX_POINTS:
+        points, offset = await get_clients().aqdrant.scroll(**_scroll_kwargs(collection_name, query_filter, offset, len(docs)))
+        if not _collect_page(collection_name, law_name, points, docs, law_names):
+            return []
+        if offset is None:
+            break
+    return sorted(docs, key=_chunk_order)
+
+
+def _count_lookup(docs: list):
+    metrics.incr("lookup.direct" if docs else "lookup.vector_fallback")
+
+
+def direct_lookup(question: str) -> list:
+    docs = []
+    for collection_name, query_filter, law_name in _lookup_requests(question):
+        docs.extend(_lookup_reference(collection_name, query_filter, law_name))
+
+    _count_lookup(docs)
+    return docs
+
+
+async def adirect_lookup(question: str) -> list:
+    # References are scrolled concurrently; results keep the question's order
+    results = await asyncio.gather(*[
+        _alookup_reference(collection_name, query_filter, law_name)
+        for collection_name, query_filter, law_name in _lookup_requests(question)
+    ])
+
+    docs = [doc for reference_docs in results for doc in reference_docs]
+    _count_lookup(docs)
+    return docs
+
+
 # =========================
 # DOCUMENT RETRIEVAL
 # =========================
-def retrieve_documents(question: str, query_type: str,
-                       constitution_store, case_store, act_store):
+# Each branch searches one collection under its own timeout; a slow or
+# failing branch contributes nothing instead of stalling the answer.
+BRANCH_TIMEOUTS = {
+    "constitution": float(os.getenv("CONSTITUTION_SEARCH_TIMEOUT", 3.0)),
+    "acts": float(os.getenv("ACTS_SEARCH_TIMEOUT", 3.0)),
+    "cases": float(os.getenv("CASES_SEARCH_TIMEOUT", 4.0)),
+}
+
+_search_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_WORKERS", 8)),
+    thread_name_prefix="retrieve"
+)
+
+
+def retrieval_plan(question: str, query_type: str) -> list[tuple[str, int]]:
+    """(branch, k) pairs to search for a query type, in merge order."""
     query_type = query_type.lower()
-    docs = []
 
     if query_type == "lookup":
         if "article" in question.lower():
-            docs.extend(hybrid_constitution_search(constitution_store, question))
+            return [("constitution", 3)]
         elif "section" in question.lower():
-            docs.extend(retrieve_act_semantic(act_store, question))
+            return [("acts", 5)]
+        return []
 
     elif query_type == "case_based":
-        docs.extend(hybrid_constitution_search(constitution_store, question, k=3))
-        docs.extend(retrieve_act_semantic(act_store, question, k=5))
-        docs.extend(hybrid_case_search(case_store, question, k=5))
+        return [("constitution", 3), ("acts", 5), ("cases", 5)]
 
     elif query_type == "predictive":
-        docs.extend(hybrid_case_search(case_store, question, k=6))
-        docs.extend(retrieve_act_semantic(act_store, question, k=5))
+        return [("cases", 6), ("acts", 5)]
 
     else:
-        docs.extend(hybrid_constitution_search(constitution_store, question, k=4))
-        docs.extend(retrieve_act_semantic(act_store, question, k=5))
+        return [("constitution", 4), ("acts", 5)]
+
+
+def _branch_failed(branch: str, reason: str):
+    print(f"[RETRIEVE] {branch} search dropped: {reason}")
+    metrics.incr(f"retrieval.{branch}.dropped")
+
+
+def retrieve_documents(question: str, query_type: str,
+                       constitution_store, case_store, act_store, query_vec=None):
+    if query_type.lower() == "lookup":
+        docs = direct_lookup(question)
+        if docs:
+            return docs
+
+    # Embed once and search every collection by vector
+    query_vec = query_vector(question, query_vec)
+
+    searches = {
+        "constitution": lambda k: hybrid_constitution_search(constitution_store, question, k=k, query_vec=query_vec),
+        "acts": lambda k: retrieve_act_semantic(act_store, question, k=k, query_vec=query_vec),
+        "cases": lambda k: hybrid_case_search(case_store, question, k=k, query_vec=query_vec),
+    }
+
+    started = time.monotonic()
+    futures = [
+        (branch, _search_pool.submit(searches[branch], k))
+        for branch, k in retrieval_plan(question, query_type)
+    ]
+
+    # Merge in plan order so the context layout stays stable
+    docs = []
+    for branch, future in futures:
+        remaining = max(0.0, started + BRANCH_TIMEOUTS[branch] - time.monotonic())
+        try:
+            docs.extend(future.result(timeout=remaining))
+        except FutureTimeoutError:
+            future.cancel()
+            _branch_failed(branch, "timeout")
+        except Exception as e:
+            _branch_failed(branch, repr(e))
 
     if not docs:
         raise ValueError("No relevant legal context found.")
@@ -258,19 +440,38 @@ def call_groq(groq_client, prompt: str) -> str:
 # =========================
 # MAIN RAG PIPELINE
 # =========================
-def legal_rag_answer(question: str, user_id: str, user_role: str):
-    constitution_store, case_store, act_store, groq_client = init_clients()
-    
-    if user_id is None:
-        user_id = str(uuid.uuid4())
+LAWYER_RECOMMENDATION_ANSWER = "As a lawyer, you may ask legal questions or analyze legal issues. Lawyer recommendation is available only for general users. "
+
+NOT_LEGAL_ANSWER = (
+    "This question is not related to Nepali law, legal provisions, "
+    "or judicial matters. Please ask a legal question."
+)
+
+
+def normalize_user_role(user_role: str) -> str:
     user_role = user_role.upper()
 
     if user_role in ["LAWYER", "FIRM"]:
         user_role = "LAWYER"
-    else:
-        user_role = user_role
+    return user_role
+
+
+def build_prompt(question: str, query_type: str, docs, user_role: str) -> str:
+    context = format_context(docs)
+    prompt_template = select_prompt(query_type)
 
-    query_type = classify_query_llm(question)
+    print('extracted prompt')
+    return prompt_template.format(context=context, question=question,user_role=user_role)
+
+
+def legal_rag_answer(question: str, user_id: str, user_role: str, query_vec=None):
+    constitution_store, case_store, act_store, groq_client = init_clients()
+    
+    if user_id is None:
+        user_id = str(uuid.uuid4())
+    user_role = normalize_user_role(user_role)
+
+    query_type = classify_query(question, query_vec)
 
     print(f"query: {query_type}")
     # Initialize the response dictionary
@@ -284,54 +485,350 @@ def legal_rag_answer(question: str, user_id: str, user_role: str):
         # print(user_role)
         # Fetch the user's past queries from the database
         if user_role in ["LAWYER", "FIRM"]:
-            response_data["answer"] = "As a lawyer, you may ask legal questions or analyze legal issues. Lawyer recommendation is available only for general users. "
-                
-                
-            
+            response_data["answer"] = LAWYER_RECOMMENDATION_ANSWER
             response_data["case_category"] = ""
 
         else:
         # Normal user flow
-            user_queries = fetch_user_queries(user_id)
+            user_queries = recent_user_queries(user_id)
             lawyer_type = recommend_lawyer_from_history(question,user_queries)
 
             response_data["answer"] = ""
             response_data["case_category"] = lawyer_type
-        # store_user_query(
-        #     user_id=user_id,
-        #     query=question,
-        #     query_type=query_type,
-        #     response=response_data
-        # )
+
+        # Write-behind: queued here, inserted in batches off the request path
+        record_query(user_id, question, query_type, response_data)
         
     elif query_type == "NOT_LEGAL":
-        response_data["answer"] = (
-            "This question is not related to Nepali law, legal provisions, "
-            "or judicial matters. Please ask a legal question."
-        )
+        response_data["answer"] = NOT_LEGAL_ANSWER
         response_data["case_category"] = "" # No recommendations for non-legal queries
         
     else:
+        # Answers shared across users with the same role and query type
+        if GLOBAL_CACHE_ENABLED:
+            query_vec = query_vector(question, query_vec)
+            cached_answer = get_global_cache(question, query_vec, user_role, query_type)
+            if cached_answer:
+                response_data["answer"] = cached_answer
+                record_query(user_id, question, query_type, response_data)
+                return response_data
+
         # Process normal legal queries
-        docs = retrieve_documents(question, query_type, constitution_store, case_store, act_store)
-        context = format_context(docs)
-        prompt_template = select_prompt(query_type)
-        
+        docs = retrieve_documents(question, query_type, constitution_store, case_store, act_store, query_vec=query_vec)
+
         # Prepare the prompt and get response from Groq
-        print('extracted prompt')
-        prompt = prompt_template.format(context=context, question=question,user_role=user_role)
-        # print(prompt)
+        prompt = build_prompt(question, query_type, docs, user_role)
         response_data["answer"] = call_groq(groq_client, prompt)
+
+        if GLOBAL_CACHE_ENABLED:
+            set_global_cache(question, query_vec, user_role, query_type, response_data["answer"])
         
        
+        response_data["case_category"] = ""
+
         # Store the query in the database
-        # store_user_query(
-        #     user_id=user_id,
-        #     query=question,
-        #     query_type=query_type,
-        #     response=response_data
-        # )
-        
-        response_data["case_category"] = ""  
+        record_query(user_id, question, query_type, response_data)
     
-    return response_data
\ No newline at end of file
+    return response_data
+
+# =========================
+# ASYNC SEARCH HELPERS
+# =========================
+async def aquery_vector(query: str, query_vec=None) -> list:
+    if query_vec is None:
+        query_vec = await embeddings.aembed_query(query)
+    return np.asarray(query_vec, dtype=float).tolist()
+
+
+async def asearch(collection_name: str, query_vec: list, k: int, query_filter=None) -> list:
+    result = await get_clients().aqdrant.query_points(
+        collection_name=collection_name,
+        query=query_vec,
+        query_filter=query_filter,
+        search_params=SEARCH_PARAMS,
+        limit=k,
+        with_payload=True
+    )
+    return [(point_to_document(p, collection_name), p.score) for p in result.points]
+
+
+async def afallback_search(collection_name: str, query_vec: list, k: int, query_filter=None) -> list:
+    responses = await get_clients().aqdrant.query_batch_points(
+        collection_name=collection_name,
+        requests=fallback_search_requests(query_vec, k, query_filter)
+    )
+    return first_hits(responses, collection_name)
+
+
+async def ahybrid_constitution_search(query: str, k: int = 3, query_vec=None):
+    query_vec = await aquery_vector(query, query_vec)
+    docs = local_constitution_search(query, k, query_vec)
+    if docs is not None:
+        return docs
+
+    return await afallback_search(CONSTITUTION_COLLECTION, query_vec, k, article_filter(query))
+
+
+async def aretrieve_act_semantic(query: str, k: int = 5, query_vec=None):
+    query_vec = await aquery_vector(query, query_vec)
+    return await afallback_search(ACTS_COLLECTION, query_vec, k, section_filter(query))
+
+
+async def ahybrid_case_search(query: str, k: int = 5, query_vec=None):
+    query_vec = await aquery_vector(query, query_vec)
+    results = await asearch(CASES_COLLECTION, query_vec, k)
+
+    return filter_by_similarity(
+        results,
+        SIMILARITY_THRESHOLD,
+        label="CASE LAW"
+    )
+
+
+async def _asearch_branch(branch: str, search):
+    try:
+        return await asyncio.wait_for(search, BRANCH_TIMEOUTS[branch])
+    except asyncio.TimeoutError:
+        _branch_failed(branch, "timeout")
+    except Exception as e:
+        _branch_failed(branch, repr(e))
+    return []
+
+
+ASYNC_SEARCHES = {
+    "constitution": ahybrid_constitution_search,
+    "acts": aretrieve_act_semantic,
+    "cases": ahybrid_case_search,
+}
+
+
+# =========================
+# SPECULATIVE RETRIEVAL
+# =========================
+# Constitution k=4 + acts k=5 covers the default, lookup and case_based
+# plans for those collections, so it can run while classification is in flight.
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+SPECULATIVE_PLAN = [("constitution", 4), ("acts", 5)]
+
+
+def _discard_outcome(task: asyncio.Task):
+    # Speculative tasks may never be awaited; mark their exceptions as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class SpeculativeRetrieval:
+    """Query embedding and superset retrieval started before the query type is known."""
+
+    def __init__(self, question: str, query_vec=None):
+        self.query_vec = asyncio.create_task(aquery_vector(question, query_vec))
+        self.branches = {
+            branch: (k, asyncio.create_task(self._search(question, branch, k)))
+            for branch, k in SPECULATIVE_PLAN
+        }
+        self.query_vec.add_done_callback(_discard_outcome)
+        for _, task in self.branches.values():
+            task.add_done_callback(_discard_outcome)
+        metrics.incr("speculative.started")
+
+    async def _search(self, question: str, branch: str, k: int):
+        query_vec = await self.query_vec
+        return await _asearch_branch(branch, ASYNC_SEARCHES[branch](question, k=k, query_vec=query_vec))
+
+    async def take(self, branch: str, k: int):
+        """Speculative results for a branch if they cover the top k, otherwise None."""
+        if branch not in self.branches or self.branches[branch][0] < k:
+            return None
+
+        _, task = self.branches.pop(branch)
+        metrics.incr("speculative.branches_used")
+        return (await task)[:k]
+
+    def cancel(self):
+        # Whatever was not taken by now is wasted work
+        for _, task in self.branches.values():
+            task.cancel()
+            metrics.incr("speculative.branches_wasted")
+        self.branches = {}
+        self.query_vec.cancel()
+
+
+async def aretrieve_documents(question: str, query_type: str, query_vec=None, speculation=None):
+    if query_type.lower() == "lookup":
+        docs = await adirect_lookup(question)
+        if docs:
+            if speculation is not None:
+                speculation.cancel()
+            return docs
+
+    if speculation is not None:
+        query_vec = await speculation.query_vec
+    query_vec = await aquery_vector(question, query_vec)
+
+    async def search_branch(branch: str, k: int):
+        if speculation is not None:
+            docs = await speculation.take(branch, k)
+            if docs is not None:
+                return docs
+        return await _asearch_branch(branch, ASYNC_SEARCHES[branch](question, k=k, query_vec=query_vec))
+
+    # All collections are searched concurrently, results keep plan order
+    results = await asyncio.gather(*[
+        search_branch(branch, k)
+        for branch, k in retrieval_plan(question, query_type)
+    ])
+
+    if speculation is not None:
+        speculation.cancel()
+
+    docs = [doc for branch_docs in results for doc in branch_docs]
+    if not docs:
+        raise ValueError("No relevant legal context found.")
+
+    return docs
+
+
+# =========================
+# ASYNC RAG PIPELINE
+# =========================
+async def acall_groq(prompt: str) -> str:
+    response = await get_clients().agroq.chat.completions.create(
+        model="openai/gpt-oss-20b",
+        messages=[
+            {"role": "system", "content": "You are a senior Nepali legal expert."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.2,
+        max_tokens=1500
+    )
+    return response.choices[0].message.content
+
+
+async def astream_groq(prompt: str):
+    """Yields answer tokens from Groq as they are generated."""
+    stream = await get_clients().agroq.chat.completions.create(
+        model="openai/gpt-oss-20b",
+        messages=[
+            {"role": "system", "content": "You are a senior Nepali legal expert."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.2,
+        max_tokens=1500,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def citations(docs) -> list[dict]:
+    """Source references for retrieved documents, sent ahead of a streamed answer."""
+    refs = []
+    for item in docs:
+        d = item[0] if isinstance(item, tuple) else item
+        meta = d.metadata
+        doc_type = meta.get("doc_type", "").lower()
+
+        if doc_type == "constitution":
+            ref = {"article_number": meta.get("article_number"), "article_title": meta.get("article_title")}
+        elif doc_type == "statute":
+            ref = {"section_number": meta.get("section_number"), "section_title": meta.get("section_title")}
+        elif doc_type == "case_law":
+            ref = {"case_title": meta.get("case_title"), "court": meta.get("court")}
+        else:
+            ref = {}
+
+        refs.append({"doc_type": doc_type, "law_name": meta.get("law_name"), **ref})
+    return refs
+
+
+async def aprepare_answer(question: str, user_id: str, user_role: str, query_vec=None) -> dict:
+    """
+    Classifies and retrieves for a question. Returns the response skeleton
+    and, for legal questions that still need generation, the Groq prompt.
+    """
+    if user_id is None:
+        user_id = str(uuid.uuid4())
+    user_role = normalize_user_role(user_role)
+
+    speculation = SpeculativeRetrieval(question, query_vec) if SPECULATIVE_RETRIEVAL else None
+    try:
+        query_type = await aclassify_query(question, query_vec)
+    except Exception:
+        if speculation is not None:
+            speculation.cancel()
+        raise
+
+    # Only legal answers use the speculative results
+    if speculation is not None and query_type in ["RECOMMENDATION", "NOT_LEGAL"]:
+        speculation.cancel()
+        speculation = None
+
+    print(f"query: {query_type}")
+    prepared = {
+        "response": {
+            "answer": "",
+            "query_type": query_type,
+            "case_category": ""
+        },
+        "prompt": None,
+        "docs": [],
+        "query_vec": query_vec,
+        "user_role": user_role,
+        "user_id": user_id
+    }
+    response_data = prepared["response"]
+
+    if query_type == "RECOMMENDATION":
+        if user_role in ["LAWYER", "FIRM"]:
+            response_data["answer"] = LAWYER_RECOMMENDATION_ANSWER
+        else:
+            user_queries = await arecent_user_queries(user_id)
+            response_data["case_category"] = await arecommend_lawyer_from_history(question, user_queries)
+        record_query(user_id, question, query_type, response_data)
+
+    elif query_type == "NOT_LEGAL":
+        response_data["answer"] = NOT_LEGAL_ANSWER
+
+    else:
+        if GLOBAL_CACHE_ENABLED:
+            query_vec = prepared["query_vec"] = await aquery_vector(question, query_vec)
+            cached_answer = await aget_global_cache(question, query_vec, user_role, query_type)
+            if cached_answer:
+                if speculation is not None:
+                    speculation.cancel()
+                response_data["answer"] = cached_answer
+                record_query(user_id, question, query_type, response_data)
+                return prepared
+
+        prepared["docs"] = await aretrieve_documents(question, query_type, query_vec=query_vec, speculation=speculation)
+        prepared["prompt"] = build_prompt(question, query_type, prepared["docs"], user_role)
+
+    return prepared
+
+
+async def afinish_answer(question: str, prepared: dict, answer: str) -> dict:
+    """Stores a generated answer in the response, the global cache and the query history."""
+    response_data = prepared["response"]
+    response_data["answer"] = answer
+    record_query(prepared["user_id"], question, response_data["query_type"], response_data)
+
+    if GLOBAL_CACHE_ENABLED:
+        await aset_global_cache(
+            question,
+            prepared["query_vec"],
+            prepared["user_role"],
+            response_data["query_type"],
+            answer
+        )
+    return response_data
+
+
+async def alegal_rag_answer(question: str, user_id: str, user_role: str, query_vec=None):
+    """Async counterpart of legal_rag_answer used by the FastAPI endpoints."""
+    prepared = await aprepare_answer(question, user_id, user_role, query_vec)
+
+    if prepared["prompt"] is None:
+        return prepared["response"]
+
+    return await afinish_answer(question, prepared, await acall_groq(prepared["prompt"]))
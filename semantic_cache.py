@@ -1,50 +1,284 @@
+import os
 import json
+import time
+import base64
+import hashlib
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from redis_client import redis_client, REDIS_TTL
+from redis_client import redis_client, async_redis_client, REDIS_TTL
+from lookup import parse_references
 
 SIM_THRESHOLD = 0.8
+SESSION_MAX_ENTRIES = int(os.getenv("SEM_CACHE_MAX_ENTRIES", 64))
 
 
 def normalize(text: str):
     return text.lower().strip()
 
 
-def get_semantic_cache(session_id: str, query: str, embedder):
-    query_vec = embedder.embed_query(query)
+# =========================
+# VECTOR PACKING
+# =========================
+def unit_vector(vec) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
 
-    # Convert to list if needed
-    if isinstance(query_vec, np.ndarray):
-        query_vec = query_vec.tolist()
 
-    keys = redis_client.keys(f"sem:{session_id}:*")
+def pack_vector(vec: np.ndarray) -> str:
+    return base64.b64encode(vec.astype(np.float32).tobytes()).decode("ascii")
 
-    for k in keys:
-        data = json.loads(redis_client.get(k))
-        cached_vec = data["embedding"]
 
-        sim = cosine_similarity([query_vec], [cached_vec])[0][0]
-        if sim >= SIM_THRESHOLD:
-            return data["answer"]
+def query_field(query: str) -> str:
+    return hashlib.sha1(normalize(query).encode("utf-8")).hexdigest()
 
+
+def best_match(raw_entries, query_vec: np.ndarray, threshold: float):
+    """
+    Scores every cached entry against the query with a single
+    matrix-vector product and returns the best entry above threshold.
+    """
+    entries, packed = [], []
+    for raw in raw_entries:
+        entry = json.loads(raw)
+        vec_bytes = base64.b64decode(entry["embedding"])
+        # Skip vectors written with a different embedding size
+        if len(vec_bytes) == query_vec.nbytes:
+            entries.append(entry)
+            packed.append(vec_bytes)
+
+    if not entries:
+        return None
+
+    matrix = np.frombuffer(b"".join(packed), dtype=np.float32).reshape(len(entries), -1)
+    scores = matrix @ query_vec
+    best = int(np.argmax(scores))
+
+    if scores[best] >= threshold:
+        return entries[best]
     return None
 
 
-def set_semantic_cache(session_id: str, query: str, answer: str, embedder):
-    vec = embedder.embed_query(query)
+def cache_entry(query: str, vec: np.ndarray, answer) -> str:
+    return json.dumps({
+        "question": query,
+        "embedding": pack_vector(vec),
+        "answer": answer,
+        "ts": time.time()
+    })
+
+
+def oldest_fields(cached: dict, max_entries: int) -> list[str]:
+    if len(cached) <= max_entries:
+        return []
+
+    by_age = sorted(cached.items(), key=lambda kv: json.loads(kv[1]).get("ts", 0))
+    return [field for field, _ in by_age[:len(cached) - max_entries]]
+
+
+# =========================
+# PER-SESSION CACHE
+# =========================
+def _session_key(session_id: str) -> str:
+    return f"sem:{session_id}"
+
+
+def get_semantic_cache(session_id: str, query: str, embedder, query_vec=None):
+    if query_vec is None:
+        query_vec = embedder.embed_query(query)
+    query_vec = unit_vector(query_vec)
+
+    # Whole session cache in one round trip
+    cached = redis_client.hgetall(_session_key(session_id))
+
+    entry = best_match(cached.values(), query_vec, SIM_THRESHOLD)
+    return entry["answer"] if entry else None
+
+
+def _evict_oldest(key: str, max_entries: int):
+    stale = oldest_fields(redis_client.hgetall(key), max_entries)
+    if stale:
+        redis_client.hdel(key, *stale)
+
+
+def set_semantic_cache(session_id: str, query: str, answer: str, embedder, query_vec=None):
+    if query_vec is None:
+        query_vec = embedder.embed_query(query)
+    vec = unit_vector(query_vec)
+    key = _session_key(session_id)
+
+    pipe = redis_client.pipeline()
+    pipe.hset(key, query_field(query), cache_entry(query, vec, answer))
+    pipe.expire(key, REDIS_TTL)
+    pipe.hlen(key)
+    size = pipe.execute()[-1]
+
+    if size > SESSION_MAX_ENTRIES:
+        _evict_oldest(key, SESSION_MAX_ENTRIES)
+
+
+async def aget_semantic_cache(session_id: str, query: str, embedder, query_vec=None):
+    if query_vec is None:
+        query_vec = await embedder.aembed_query(query)
+    query_vec = unit_vector(query_vec)
+
+    cached = await async_redis_client.hgetall(_session_key(session_id))
+
+    entry = best_match(cached.values(), query_vec, SIM_THRESHOLD)
+    return entry["answer"] if entry else None
+
+
+async def _aevict_oldest(key: str, max_entries: int):
+    stale = oldest_fields(await async_redis_client.hgetall(key), max_entries)
+    if stale:
+        await async_redis_client.hdel(key, *stale)
+
+
+async def aset_semantic_cache(session_id: str, query: str, answer: str, embedder, query_vec=None):
+    if query_vec is None:
+        query_vec = await embedder.aembed_query(query)
+    vec = unit_vector(query_vec)
+    key = _session_key(session_id)
+
+    pipe = async_redis_client.pipeline()
+    pipe.hset(key, query_field(query), cache_entry(query, vec, answer))
+    pipe.expire(key, REDIS_TTL)
+    pipe.hlen(key)
+    size = (await pipe.execute())[-1]
+
+    if size > SESSION_MAX_ENTRIES:
+        await _aevict_oldest(key, SESSION_MAX_ENTRIES)
+
+
+# =========================
+# GLOBAL (CROSS-USER) CACHE
+# =========================
+# Opt-in tier shared by all users, keyed by (query embedding, user_role,
+# query_type, cited articles/sections/law). Entries are filed under random-hyperplane LSH buckets so a
+# lookup only reads LSH_TABLES candidate buckets instead of every entry.
+GLOBAL_CACHE_ENABLED = os.getenv("GLOBAL_CACHE_ENABLED", "false").lower() == "true"
+GLOBAL_SIM_THRESHOLD = float(os.getenv("GLOBAL_SIM_THRESHOLD", 0.92))
+GLOBAL_CACHE_TTL = int(os.getenv("GLOBAL_CACHE_TTL", 86400))
+GLOBAL_BUCKET_MAX_ENTRIES = int(os.getenv("GLOBAL_BUCKET_MAX_ENTRIES", 256))
+LSH_TABLES = int(os.getenv("LSH_TABLES", 4))
+LSH_BITS = int(os.getenv("LSH_BITS", 12))
+LSH_SEED = int(os.getenv("LSH_SEED", 1337))
+
+GLOBAL_STATS_KEY = "gsem:stats"
+
+_hyperplanes = {}
+
+
+def _lsh_planes(dim: int) -> np.ndarray:
+    # Seeded so every worker hashes into the same buckets
+    if dim not in _hyperplanes:
+        rng = np.random.default_rng(LSH_SEED)
+        _hyperplanes[dim] = rng.standard_normal((LSH_TABLES, LSH_BITS, dim)).astype(np.float32)
+    return _hyperplanes[dim]
+
+
+def lsh_buckets(vec: np.ndarray) -> list[str]:
+    bits = (_lsh_planes(vec.shape[0]) @ vec) > 0
+    signatures = bits.astype(np.int64) @ (1 << np.arange(LSH_BITS, dtype=np.int64))
+    return [f"{table}:{sig:x}" for table, sig in enumerate(signatures)]
+
+
+def _reference_scope(query: str) -> str:
+    # "Article 16" and "Article 17" questions embed almost identically, so the
+    # cited references are part of the key, not left to the similarity threshold
+    refs = parse_references(query)
+    if not (refs["articles"] or refs["sections"]):
+        return "-"
+    scope = "|".join([",".join(sorted(refs["articles"])), ",".join(sorted(refs["sections"])), refs["law_name"] or ""])
+    return hashlib.sha1(scope.encode("utf-8")).hexdigest()[:12]
+
+
+def _global_bucket_keys(query: str, vec: np.ndarray, user_role: str, query_type: str) -> list[str]:
+    scope = _reference_scope(query)
+    return [
+        f"gsem:{user_role.upper()}:{query_type.upper()}:{scope}:{bucket}"
+        for bucket in lsh_buckets(vec)
+    ]
+
+
+def _global_candidates(buckets: list[dict]) -> dict:
+    # The same entry is filed in every table, keep one copy per field
+    candidates = {}
+    for bucket in buckets:
+        candidates.update(bucket)
+    return candidates
+
+
+def get_global_cache(query: str, query_vec, user_role: str, query_type: str):
+    query_vec = unit_vector(query_vec)
+
+    pipe = redis_client.pipeline()
+    for key in _global_bucket_keys(query, query_vec, user_role, query_type):
+        pipe.hgetall(key)
+    candidates = _global_candidates(pipe.execute())
+
+    entry = best_match(candidates.values(), query_vec, GLOBAL_SIM_THRESHOLD)
+    redis_client.hincrby(GLOBAL_STATS_KEY, "hits" if entry else "misses", 1)
+
+    return entry["answer"] if entry else None
+
+
+def set_global_cache(query: str, query_vec, user_role: str, query_type: str, answer: str):
+    query_vec = unit_vector(query_vec)
+    keys = _global_bucket_keys(query, query_vec, user_role, query_type)
+    entry = cache_entry(query, query_vec, answer)
+
+    pipe = redis_client.pipeline()
+    for key in keys:
+        pipe.hset(key, query_field(query), entry)
+        pipe.expire(key, GLOBAL_CACHE_TTL)
+        pipe.hlen(key)
+    sizes = pipe.execute()[2::3]
+
+    for key, size in zip(keys, sizes):
+        if size > GLOBAL_BUCKET_MAX_ENTRIES:
+            _evict_oldest(key, GLOBAL_BUCKET_MAX_ENTRIES)
+
+
+async def aget_global_cache(query: str, query_vec, user_role: str, query_type: str):
+    query_vec = unit_vector(query_vec)
+
+    pipe = async_redis_client.pipeline()
+    for key in _global_bucket_keys(query, query_vec, user_role, query_type):
+        pipe.hgetall(key)
+    candidates = _global_candidates(await pipe.execute())
+
+    entry = best_match(candidates.values(), query_vec, GLOBAL_SIM_THRESHOLD)
+    await async_redis_client.hincrby(GLOBAL_STATS_KEY, "hits" if entry else "misses", 1)
+
+    return entry["answer"] if entry else None
+
+
+async def aset_global_cache(query: str, query_vec, user_role: str, query_type: str, answer: str):
+    query_vec = unit_vector(query_vec)
+    keys = _global_bucket_keys(query, query_vec, user_role, query_type)
+    entry = cache_entry(query, query_vec, answer)
+
+    pipe = async_redis_client.pipeline()
+    for key in keys:
+        pipe.hset(key, query_field(query), entry)
+        pipe.expire(key, GLOBAL_CACHE_TTL)
+        pipe.hlen(key)
+    sizes = (await pipe.execute())[2::3]
+
+    for key, size in zip(keys, sizes):
+        if size > GLOBAL_BUCKET_MAX_ENTRIES:
+            await _aevict_oldest(key, GLOBAL_BUCKET_MAX_ENTRIES)
 
-    # 🔑 Convert ndarray → list for JSON
-    if isinstance(vec, np.ndarray):
-        vec = vec.tolist()
 
-    key = f"sem:{session_id}:{hash(normalize(query))}"
+def global_cache_stats() -> dict:
+    stats = redis_client.hgetall(GLOBAL_STATS_KEY)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    lookups = hits + misses
 
-    redis_client.setex(
-        key,
-        REDIS_TTL,
-        json.dumps({
-            "question": query,
-            "embedding": vec,
-            "answer": answer
-        })
-    )
+    return {
+        "enabled": GLOBAL_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else 0.0
+    }